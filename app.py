@@ -1,38 +1,54 @@
 import os
-import threading
 import logging
 import fcntl
 import atexit
 import time
+import json
 from logging.handlers import RotatingFileHandler
 from datetime import datetime, timedelta
-from flask import Flask, render_template, send_from_directory, redirect, url_for, flash, request
+from flask import Flask, render_template, send_from_directory, redirect, url_for, flash, request, abort, jsonify, \
+    Response, stream_with_context, g, before_render_template, template_rendered
+from werkzeug.security import safe_join
 from flask_login import LoginManager, UserMixin, login_user, login_required, logout_user, current_user
 from apscheduler.schedulers.background import BackgroundScheduler
 from dotenv import load_dotenv
 
 from zeitung import ZeitungScraper, base_dir
 import indexer
+import jobs
+import metrics
+import profiling
+import logs
+from pipeline import ArchivePipeline
 
 # Kompressor Import
 try:
-    from compressor import compress_pdf
+    from compressor import compress_pdf, linearize_archive, compress_archive
 except ImportError:
-    def compress_pdf(path):
+    def compress_pdf(path, linearize=None, parallel=None, force=False):
         return False
 
+    def linearize_archive(base_dir):
+        return 0
+
+    def compress_archive(base_dir):
+        return 0
+
 load_dotenv()
 
+# Optional: Token für den Abruf von /metrics durch Prometheus (sonst nur für eingeloggte Admins)
+METRICS_TOKEN = os.getenv('METRICS_TOKEN')
+
 app = Flask(__name__)
 app.secret_key = os.getenv('SECRET_KEY', 'dev_key')
 
 # --- LOGGING SETUP ---
-log_formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
 log_file = base_dir / 'system.log'
 
 # Rotating File Handler: Max 1MB, 1 Backup
+# Eine JSON-Zeile pro Eintrag (Level, Komponente, Job-ID), damit die Admin-Konsole filtern kann
 file_handler = RotatingFileHandler(log_file, maxBytes=1 * 1024 * 1024, backupCount=1)
-file_handler.setFormatter(log_formatter)
+file_handler.setFormatter(logs.JsonFormatter())
 
 root_logger = logging.getLogger()
 root_logger.setLevel(logging.INFO)
@@ -68,20 +84,69 @@ def load_user(user_id):
     return None
 
 
-# --- HINTERGRUND PROZESSE ---
-process_lock = threading.Lock()
-is_busy = False
+# --- METRIKEN ---
+@app.before_request
+def start_timer():
+    g.request_started = time.perf_counter()
+
+
+@app.after_request
+def record_request_time(response):
+    started = g.pop('request_started', None)
+    if started is not None:
+        route = request.url_rule.rule if request.url_rule else 'unbekannt'
+        metrics.REQUEST_SECONDS.labels(route=route, method=request.method).observe(time.perf_counter() - started)
+    return response
+
+
+# --- PROFILING (opt-in über PROFILING=true) ---
+@app.before_request
+def start_profiling():
+    if not profiling.PROFILING:
+        return
+    profiling.start_request()
+    if request.args.get('profile') and current_user.is_authenticated and current_user.is_admin:
+        profiling.start_sampling()
+
+
+@app.after_request
+def finish_profiling(response):
+    if not profiling.PROFILING:
+        return response
+    duration, phases = profiling.finish_request(request.method, request.full_path.rstrip('?'),
+                                                response.status_code)
+    if duration is not None:
+        # Im Browser unter DevTools -> Network -> Timing sichtbar
+        timings = [f"{name};dur={seconds * 1000:.1f}" for name, seconds in phases.items()]
+        response.headers['Server-Timing'] = ', '.join(timings + [f"total;dur={duration * 1000:.1f}"])
+    return response
+
+
+def _template_started(sender, template, context, **extra):
+    g.template_started = time.perf_counter()
+
+
+def _template_finished(sender, template, context, **extra):
+    started = g.pop('template_started', None)
+    if started is not None:
+        profiling.add_phase('render', time.perf_counter() - started)
 
+
+if profiling.PROFILING:
+    before_render_template.connect(_template_started, app)
+    template_rendered.connect(_template_finished, app)
+
+
+# --- HINTERGRUND PROZESSE ---
 # DB Init beim Start
 if not os.path.exists('/app/downloads/zeitung.db'):
     indexer.init_db()
 else:
     indexer.init_db()
+profiling.init_db()
 
 
 def run_scraper_background():
-    global is_busy
-    is_busy = True
     try:
         logger.info("Starte Scraper...")
         scraper = ZeitungScraper()
@@ -90,50 +155,52 @@ def run_scraper_background():
             indexer.index_pdf(scraper.target_path)
     except Exception as e:
         logger.error(f"Scraper Fehler: {e}")
-    finally:
-        is_busy = False
-        process_lock.release()
+        raise
 
 
 def run_archive_background(date_str, range_count):
-    global is_busy
-    is_busy = True
     try:
         logger.info(f"Starte Archiv Download: {date_str} (Range: {range_count})")
-        scraper = ZeitungScraper()
-        new_files = scraper.run_archive(date_str, range_count)
-
-        for fpath in new_files:
-            if fpath.exists():
-                indexer.index_pdf(fpath)
+        # Komprimieren und Indexieren laufen schon während der weiteren Downloads
+        with ArchivePipeline(base_dir) as pipeline:
+            scraper = ZeitungScraper(on_file=pipeline.submit)
+            scraper.run_archive(date_str, range_count)
     except Exception as e:
         logger.error(f"Archiv Fehler: {e}")
-    finally:
-        is_busy = False
-        process_lock.release()
+        raise
+
 
+def run_fill_gaps_background(since_str):
+    try:
+        logger.info(f"Fülle Lücken im Archiv seit {since_str}")
+        with ArchivePipeline(base_dir) as pipeline:
+            scraper = ZeitungScraper(on_file=pipeline.submit)
+            scraper.run_fill_gaps(since_str)
+    except Exception as e:
+        logger.error(f"Lücken füllen Fehler: {e}")
+        raise
 
-def run_reindex_background():
-    global is_busy
-    is_busy = True
+
+def run_reindex_background(workers=None, full=True):
     try:
-        logger.info("Starte Re-Indexing...")
-        indexer.rebuild_index(base_dir)
+        if full:
+            logger.info("Starte Re-Indexing...")
+            indexer.rebuild_index(base_dir, workers=workers)
+        else:
+            logger.info("Starte inkrementelles Re-Indexing...")
+            indexer.update_index(base_dir, workers=workers)
     except Exception as e:
         logger.error(f"Reindex Fehler: {e}")
-    finally:
-        is_busy = False
-        process_lock.release()
+        raise
 
 
 def run_manual_compression_background(filename):
-    global is_busy
-    is_busy = True
     try:
         logger.info(f"Starte manuelle Komprimierung für {filename}...")
         path = base_dir / filename
         if path.exists():
-            success = compress_pdf(path)
+            # Manuell ausgelöst: auch bereits komprimierte Ausgaben erneut versuchen
+            success = compress_pdf(path, force=True)
             if success:
                 logger.info("Komprimierung erfolgreich.")
             else:
@@ -142,28 +209,58 @@ def run_manual_compression_background(filename):
             logger.error("Datei nicht gefunden.")
     except Exception as e:
         logger.error(f"Komprimierung Fehler: {e}")
-    finally:
-        is_busy = False
-        process_lock.release()
+        raise
 
 
-def try_start_process(target_func, *args):
-    if process_lock.acquire(blocking=False):
-        thread = threading.Thread(target=target_func, args=args)
-        thread.start()
-        return True
-    return False
+def run_linearize_background():
+    try:
+        logger.info("Starte Linearisierung des Archivs...")
+        linearize_archive(base_dir)
+    except Exception as e:
+        logger.error(f"Linearisierung Fehler: {e}")
+        raise
+
+
+def run_bulk_compression_background():
+    try:
+        logger.info("Starte Massen-Komprimierung des Archivs...")
+        compress_archive(base_dir)
+    except Exception as e:
+        logger.error(f"Massen-Komprimierung Fehler: {e}")
+        raise
+
+
+# Job-Warteschlange (SQLite, gemeinsam für alle Gunicorn Worker)
+jobs.register('scrape', run_scraper_background)
+jobs.register('archive', run_archive_background)
+jobs.register('fill_gaps', run_fill_gaps_background)
+jobs.register('reindex', run_reindex_background)
+jobs.register('compress', run_manual_compression_background)
+jobs.register('linearize', run_linearize_background)
+jobs.register('bulk_compress', run_bulk_compression_background)
+
+# Höher = wird zuerst gestartet
+JOB_PRIORITIES = {'scrape': 10, 'archive': 5, 'fill_gaps': 4, 'reindex': 5, 'compress': 3, 'linearize': 1, 'bulk_compress': 0}
+
+jobs.start_dispatcher()
+
+
+def start_job(job_type, *args):
+    """Plant einen Job ein, False wenn ein identischer Job bereits wartet"""
+    _, created = jobs.enqueue(job_type, *args, priority=JOB_PRIORITIES.get(job_type, 0))
+    return created
 
 
 # --- SCHEDULER (MIT LOCK) ---
 def job_download():
     logger.info("⏰ 06:00 - Auto-Download gestartet")
-    try_start_process(run_scraper_background)
+    start_job('scrape')
 
 
 def job_reindex():
     logger.info("⏰ 06:15 - Auto-Reindex gestartet")
-    try_start_process(run_reindex_background)
+    # Nur neue/geänderte Dateien (Manifest-Abgleich)
+    start_job('reindex', None, False)
 
 
 # Globale Referenz halten
@@ -247,18 +344,22 @@ def index():
     selected_week = request.args.get('week', current_week_id)
 
     files = []
-    available_weeks = set()
+    sorted_weeks = []
+
+    # Suche: Seitenweise, sortiert nach Datum oder Relevanz
+    sort = request.args.get('sort', 'date')
+    page = max(request.args.get('page', 1, type=int), 1)
+    total_hits = 0
+    total_pages = 1
 
     if query:
-        files = indexer.search_articles(query)
-        flash(f'{len(files)} Treffer für "{query}" gefunden.', 'info')
+        page_size = indexer.SEARCH_PAGE_SIZE
+        files, total_hits = indexer.search_articles(query, limit=page_size, offset=(page - 1) * page_size, sort=sort)
+        total_pages = max((total_hits + page_size - 1) // page_size, 1)
+        flash(f'{total_hits} Treffer für "{query}" gefunden.', 'info')
     else:
-        all_files = indexer.get_all_files(base_dir)
-        for f in all_files:
-            available_weeks.add(f['week_id'])
-        files = [f for f in all_files if f['week_id'] == selected_week]
-
-    sorted_weeks = sorted(list(available_weeks), reverse=True)
+        files = indexer.get_all_files(base_dir, selected_week)
+        sorted_weeks = indexer.get_available_weeks()
 
     try:
         y, w = map(int, selected_week.split('-W'))
@@ -274,40 +375,106 @@ def index():
     return render_template('index.html',
                            files=files,
                            query=query,
-                           is_scraping=is_busy,
+                           sort=sort,
+                           page=page,
+                           total_pages=total_pages,
+                           is_scraping=jobs.is_busy(),
                            selected_week=selected_week,
                            available_weeks=sorted_weeks,
                            prev_week=prev_week_id,
                            next_week=next_week_id)
 
 
+def file_etag(directory, filename):
+    """Starker ETag aus Größe und Änderungszeit der Datei (404 wenn nicht vorhanden)"""
+    path = safe_join(str(directory), filename)
+    if path is None or not os.path.isfile(path):
+        abort(404)
+    st = os.stat(path)
+    return f"{st.st_size:x}-{st.st_mtime_ns:x}"
+
+
 @app.route('/download/<filename>')
 @login_required
 def download_file(filename):
     force_download = request.args.get('dl') == '1'
-    response = send_from_directory(base_dir, filename, as_attachment=force_download)
-    if not force_download:
-        response.headers['Content-Disposition'] = f'inline; filename="{filename}"'
+    # conditional: 304 bei passendem ETag, Range-Requests (206) für den PDF-Viewer
+    response = send_from_directory(base_dir, filename, as_attachment=force_download, download_name=filename,
+                                   conditional=True, etag=file_etag(base_dir, filename))
+    # Browser darf cachen, muss aber nachfragen (PDF kann z.B. komprimiert werden)
+    response.headers['Cache-Control'] = 'private, no-cache'
     return response
 
 
 @app.route('/thumbnail/<filename>')
 @login_required
 def thumbnail_file(filename):
-    name_no_ext = os.path.splitext(filename)[0]
-    jpg_name = f"{name_no_ext}.jpg"
-    thumb_dir = base_dir / 'thumbnails'
-    return send_from_directory(thumb_dir, jpg_name)
+    # ?size=small (Kachel) oder ?size=large (Vorschau-Modal)
+    size = request.args.get('size', 'small')
+    if size not in indexer.THUMB_SIZES:
+        size = 'small'
+    thumb_path = indexer.thumbnail_path(filename, size)
+    if not thumb_path.exists():
+        legacy_path = indexer.THUMB_DIR / f"{os.path.splitext(filename)[0]}.jpg"
+        if legacy_path.exists():
+            # Altes Format aus früheren Versionen
+            thumb_path = legacy_path
+        else:
+            # Fehlt noch: beim ersten Abruf erzeugen
+            pdf_path = base_dir / os.path.basename(filename)
+            if indexer.ensure_thumbnail(pdf_path) != 'ok':
+                abort(404)
+    response = send_from_directory(thumb_path.parent, thumb_path.name, conditional=True,
+                                   etag=file_etag(thumb_path.parent, thumb_path.name))
+    if request.args.get('v'):
+        # Versionierte URL (Dateigröße im Link): Inhalt ändert sich nie
+        response.headers['Cache-Control'] = 'private, max-age=31536000, immutable'
+    else:
+        response.headers['Cache-Control'] = 'private, max-age=86400'
+    return response
+
+
+@app.route('/page/<filename>/<int:page>')
+@login_required
+def page_image(filename, page):
+    """Einzelne Seite als Bild (?w=Breite in Pixel), Cache auf der Platte"""
+    pdf_path = base_dir / os.path.basename(filename)
+    if not pdf_path.exists() or page < 1 or page > indexer.get_page_count(pdf_path):
+        abort(404)
+    width = request.args.get('w', 1200, type=int)
+    page_path = indexer.render_page(pdf_path, page, width)
+    if page_path is None:
+        abort(404)
+    response = send_from_directory(page_path.parent, page_path.name, conditional=True,
+                                   etag=file_etag(page_path.parent, page_path.name))
+    response.headers['Cache-Control'] = 'private, max-age=86400'
+    return response
+
+
+@app.route('/read/<filename>')
+@login_required
+def read_file(filename):
+    """Leichtgewichtiger Seiten-Viewer (ohne das ganze PDF zu laden)"""
+    pdf_path = base_dir / os.path.basename(filename)
+    if not pdf_path.exists():
+        abort(404)
+    page_count = indexer.get_page_count(pdf_path)
+    start_page = min(max(request.args.get('page', 1, type=int), 1), max(page_count, 1))
+    return render_template('reader.html',
+                           filename=pdf_path.name,
+                           date_display=indexer.format_german_date(indexer.date_from_filename(pdf_path.name)),
+                           page_count=page_count,
+                           start_page=start_page)
 
 
 @app.route('/trigger-scrape')
 @login_required
 def trigger_scrape():
     if not current_user.is_admin: return redirect(url_for('index'))
-    if try_start_process(run_scraper_background):
-        flash('Download gestartet.', 'info')
+    if start_job('scrape'):
+        flash('Download eingeplant.', 'info')
     else:
-        flash('System beschäftigt.', 'warning')
+        flash('Download ist bereits in der Warteschlange.', 'warning')
     return redirect(url_for('index'))
 
 
@@ -315,10 +482,12 @@ def trigger_scrape():
 @login_required
 def reindex():
     if not current_user.is_admin: return redirect(url_for('index'))
-    if try_start_process(run_reindex_background):
-        flash('Re-Indexing gestartet. Thumbnails werden erstellt...', 'success')
+    # ?workers=N überschreibt INDEX_WORKERS (1 = seriell)
+    workers = request.args.get('workers', type=int)
+    if start_job('reindex', workers, True):
+        flash('Re-Indexing eingeplant.', 'success')
     else:
-        flash('System beschäftigt.', 'warning')
+        flash('Re-Indexing ist bereits in der Warteschlange.', 'warning')
     return redirect(url_for('index'))
 
 
@@ -328,10 +497,27 @@ def archive_download():
     if not current_user.is_admin: return redirect(url_for('index'))
     date_str = request.form.get('date')
     range_val = int(request.form.get('range', 1))
-    if try_start_process(run_archive_background, date_str, range_val):
-        flash(f'Archiv-Download gestartet.', 'success')
+    if start_job('archive', date_str, range_val):
+        flash(f'Archiv-Download eingeplant.', 'success')
     else:
-        flash('System beschäftigt.', 'warning')
+        flash('Dieser Archiv-Download ist bereits in der Warteschlange.', 'warning')
+    return redirect(url_for('index'))
+
+
+@app.route('/fill-gaps', methods=['POST'])
+@login_required
+def fill_gaps():
+    if not current_user.is_admin: return redirect(url_for('index'))
+    since_str = request.form.get('since')
+    try:
+        datetime.strptime(since_str or '', '%Y-%m-%d')
+    except ValueError:
+        flash('Ungültiges Datum.', 'danger')
+        return redirect(url_for('index'))
+    if start_job('fill_gaps', since_str):
+        flash(f'Lücken seit {since_str} werden gefüllt.', 'success')
+    else:
+        flash('Lücken füllen ist bereits in der Warteschlange.', 'warning')
     return redirect(url_for('index'))
 
 
@@ -339,10 +525,32 @@ def archive_download():
 @login_required
 def compress_file_route(filename):
     if not current_user.is_admin: return redirect(url_for('index'))
-    if try_start_process(run_manual_compression_background, filename):
-        flash(f'Komprimierung für {filename} gestartet.', 'info')
+    if start_job('compress', filename):
+        flash(f'Komprimierung für {filename} eingeplant.', 'info')
+    else:
+        flash(f'Komprimierung für {filename} ist bereits in der Warteschlange.', 'warning')
+    return redirect(url_for('index'))
+
+
+@app.route('/compress-all')
+@login_required
+def compress_all_route():
+    if not current_user.is_admin: return redirect(url_for('index'))
+    if start_job('bulk_compress'):
+        flash('Massen-Komprimierung eingeplant (läuft mit niedriger Priorität).', 'info')
     else:
-        flash('System beschäftigt.', 'warning')
+        flash('Massen-Komprimierung ist bereits in der Warteschlange.', 'warning')
+    return redirect(url_for('index'))
+
+
+@app.route('/linearize-all')
+@login_required
+def linearize_all_route():
+    if not current_user.is_admin: return redirect(url_for('index'))
+    if start_job('linearize'):
+        flash('Linearisierung des Archivs eingeplant.', 'info')
+    else:
+        flash('Linearisierung ist bereits in der Warteschlange.', 'warning')
     return redirect(url_for('index'))
 
 
@@ -361,24 +569,118 @@ def delete_file_route(filename):
     return redirect(url_for('index'))
 
 
+@app.route('/metrics')
+def metrics_route():
+    if METRICS_TOKEN:
+        if request.headers.get('Authorization') != f'Bearer {METRICS_TOKEN}':
+            return "Access Denied", 403
+    elif not (current_user.is_authenticated and current_user.is_admin):
+        return "Access Denied", 403
+    content, content_type = metrics.render()
+    return Response(content, content_type=content_type)
+
+
+@app.route('/api/progress')
+@login_required
+def progress_json():
+    if not current_user.is_admin:
+        return "Access Denied", 403
+    return jsonify(jobs.get_progress())
+
+
+@app.route('/api/progress/stream')
+@login_required
+def progress_stream():
+    """Server-Sent Events: schickt den Job-Fortschritt, sobald er sich ändert"""
+    if not current_user.is_admin:
+        return "Access Denied", 403
+
+    def generate():
+        last = None
+        # Verbindung nach 5 Minuten beenden, der Browser verbindet sich automatisch neu
+        end_time = time.time() + 300
+        yield "retry: 3000\n\n"
+        while time.time() < end_time:
+            data = json.dumps(jobs.get_progress())
+            if data != last:
+                yield f"data: {data}\n\n"
+                last = data
+            else:
+                # Kommentar-Zeile hält die Verbindung offen
+                yield ": ping\n\n"
+            time.sleep(1)
+
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+@app.route('/admin/slow-requests')
+@login_required
+def slow_requests():
+    if not current_user.is_admin:
+        return "Access Denied", 403
+    rows = profiling.slowest_requests()
+    for row in rows:
+        row['created_display'] = datetime.fromtimestamp(row['created']).strftime('%d.%m.%Y %H:%M:%S')
+    return render_template('slow_requests.html', requests=rows, enabled=profiling.PROFILING,
+                           slow_ms=profiling.SLOW_REQUEST_MS)
+
+
+@app.route('/admin/profiles/<path:name>')
+@login_required
+def download_profile(name):
+    if not current_user.is_admin:
+        return "Access Denied", 403
+    return send_from_directory(profiling.PROFILE_DIR, name, as_attachment=True)
+
+
+def _log_filter():
+    return logs.make_filter(level=request.args.get('level'), component=request.args.get('component'),
+                            job=request.args.get('job'), query=request.args.get('q'))
+
+
 @app.route('/admin/logs')
 @login_required
 def get_logs():
+    """Letzte Log-Einträge (Standard 100), filterbar per ?level=, ?component=, ?job=, ?q="""
     if not current_user.is_admin:
         return "Access Denied", 403
 
-    log_path = base_dir / 'system.log'
-    if not log_path.exists():
+    if not log_file.exists():
         return "Noch keine Logs vorhanden."
 
+    lines = min(request.args.get('lines', 100, type=int), 5000)
     try:
-        with open(log_path, 'r', encoding='utf-8') as f:
-            lines = f.readlines()
-            last_lines = lines[-100:]
-            return "".join(last_lines)
+        entries = logs.tail(log_file, lines, _log_filter())
     except Exception as e:
         return f"Fehler beim Lesen der Logs: {e}"
 
+    if request.args.get('format') == 'json':
+        return jsonify(entries)
+    return Response("\n".join(logs.format_entry(entry) for entry in entries), mimetype='text/plain')
+
+
+@app.route('/admin/logs/stream')
+@login_required
+def stream_logs():
+    """Server-Sent Events: neue Log-Einträge, sobald sie geschrieben werden (gleiche Filter wie /admin/logs)"""
+    if not current_user.is_admin:
+        return "Access Denied", 403
+
+    matches = _log_filter()
+
+    def generate():
+        yield "retry: 3000\n\n"
+        # Verbindung nach 5 Minuten beenden, der Browser verbindet sich automatisch neu
+        for entry in logs.follow(log_file, matches, timeout=300):
+            if entry is None:
+                yield ": ping\n\n"
+            else:
+                yield f"data: {json.dumps(entry, ensure_ascii=False)}\n\n"
+
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
 
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=5000)
\ No newline at end of file
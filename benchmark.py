@@ -0,0 +1,317 @@
+"""
+Benchmark für Indexer, Suche, Wochenansicht, Thumbnails und Kompressor.
+
+Erzeugt ein reproduzierbares Test-Archiv (synthetische Zeitungs-PDFs mit deutschem Text
+und Bildern), misst die wichtigsten Funktionen und schreibt die Zeiten als JSON.
+Mit --compare wird gegen einen früheren Lauf verglichen und Verschlechterungen gemeldet.
+
+Beispiel (im Container):
+    python benchmark.py --issues 100
+    python benchmark.py --issues 1000 --compare benchmark_results/20260101-120000_100.json
+"""
+import argparse
+import io
+import json
+import logging
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import time
+from datetime import date, datetime, timedelta
+from pathlib import Path
+
+from PIL import Image
+
+# Messwerte des Benchmarks nicht in die Metriken des laufenden Servers mischen
+os.environ.pop('PROMETHEUS_MULTIPROC_DIR', None)
+
+import indexer
+
+logger = logging.getLogger(__name__)
+
+CORPUS_SIZES = (100, 1000, 10000)
+SEED = 1848
+
+# Typischer Lokalzeitungs-Wortschatz (Umlaute bewusst enthalten)
+WORDS = (
+    "Stadtrat Bürgermeister Oberbürgermeister Gemeinderat Kreisverwaltung Landkreis Haushalt Baustelle "
+    "Umleitung Rheinbrücke Nibelungenfestspiele Dom Museum Ausstellung Konzert Theater Bibliothek "
+    "Feuerwehr Polizei Rettungsdienst Einsatz Unfall Kreuzung Ampel Parkplatz Bahnhof Straßenbahn "
+    "Grundschule Gymnasium Kindergarten Schüler Lehrerin Eltern Verein Ehrenamt Jubiläum Vorsitzende "
+    "Fußball Handball Sportplatz Trainer Mannschaft Saison Tabelle Aufstieg Niederlage Sieg "
+    "Wochenmarkt Einzelhandel Innenstadt Geschäft Gastronomie Weinfest Winzer Weinberg Ernte "
+    "Kläranlage Stadtwerke Energie Photovoltaik Klimaschutz Radweg Spielplatz Friedhof Kirche "
+    "Gemeinde Pfarrer Seniorinnen Senioren Jugend Kultur Förderung Zuschuss Millionen Euro "
+    "Wahl Kandidat Partei Sitzung Beschluss Antrag Verwaltung Bürger Anwohner Nachbarschaft"
+).split()
+FILLER = "und der die das mit für auf ein eine im am zum zur über nach bei von wird wurde sind ist sich".split()
+# Nur in wenigen Ausgaben enthalten (seltener Suchbegriff)
+RARE_WORD = "Wolkenkuckucksheimverordnung"
+RARE_EVERY = 97
+COMMON_TERM = "Stadtrat"
+
+PAGE_WIDTH, PAGE_HEIGHT = 842, 1191  # A3 Hochformat in Punkt (Berliner/Rheinisches Format gerundet)
+
+
+def _pdf_string(text):
+    escaped = text.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+    return b'(' + escaped.encode('latin-1', 'replace') + b')'
+
+
+def _sentence(rng, words=12):
+    parts = [rng.choice(WORDS) if rng.random() < 0.6 else rng.choice(FILLER) for _ in range(words)]
+    return ' '.join(parts).capitalize() + '.'
+
+
+def _make_photos(rng, count=4):
+    """Einige JPEG 'Fotos' (Verlauf + Rauschen, damit sie sich ähnlich wie echte Fotos komprimieren)"""
+    photos = []
+    for _ in range(count):
+        base = Image.linear_gradient('L').resize((800, 500)).convert('RGB')
+        noise = Image.effect_noise((800, 500), 40).convert('RGB')
+        tint = Image.new('RGB', (800, 500), tuple(rng.randrange(256) for _ in range(3)))
+        photo = Image.blend(Image.blend(base, noise, 0.4), tint, 0.3)
+        buf = io.BytesIO()
+        photo.save(buf, 'JPEG', quality=90)
+        photos.append((photo.size, buf.getvalue()))
+    return photos
+
+
+def write_issue(path, issue_no, pages, rng, photos):
+    """Schreibt eine mehrseitige Ausgabe (Text in Spalten + ein Foto pro Seite) als PDF"""
+    objects = {}
+    # 1 Katalog, 2 Seitenbaum, 3 Schrift, 4.. Fotos, danach je Seite: Seite + Inhalt
+    objects[1] = b"<< /Type /Catalog /Pages 2 0 R >>"
+    objects[3] = b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>"
+    photo_ids = []
+    for i, ((width, height), data) in enumerate(photos):
+        obj_id = 4 + i
+        objects[obj_id] = (f"<< /Type /XObject /Subtype /Image /Width {width} /Height {height} "
+                           f"/ColorSpace /DeviceRGB /BitsPerComponent 8 /Filter /DCTDecode "
+                           f"/Length {len(data)} >>\nstream\n").encode() + data + b"\nendstream"
+        photo_ids.append(obj_id)
+
+    next_id = 4 + len(photos)
+    page_ids = []
+    for page_no in range(pages):
+        page_id, content_id = next_id, next_id + 1
+        next_id += 2
+        page_ids.append(page_id)
+
+        ops = [b"BT /F1 28 Tf 40 1140 Td " + _pdf_string(_sentence(rng, 6)) + b" Tj ET"]
+        photo = rng.randrange(len(photo_ids))
+        ops.append(f"q 380 0 0 240 420 860 cm /Im{photo} Do Q".encode())
+        # Vier Textspalten
+        for column in range(4):
+            x = 40 + column * 200
+            y_top = 840 if column >= 2 else 1090
+            lines = [_sentence(rng, 5) for _ in range((y_top - 60) // 12)]
+            if issue_no % RARE_EVERY == 0 and page_no == 0 and column == 0:
+                lines[3] = f"Neue {RARE_WORD} beschlossen."
+            ops.append(f"BT /F1 9 Tf 12 TL {x} {y_top} Td".encode())
+            for line in lines:
+                ops.append(_pdf_string(line[:42]) + b" '")
+            ops.append(b"ET")
+        content = b"\n".join(ops)
+        objects[content_id] = f"<< /Length {len(content)} >>\nstream\n".encode() + content + b"\nendstream"
+        xobjects = ' '.join(f"/Im{i} {obj_id} 0 R" for i, obj_id in enumerate(photo_ids))
+        objects[page_id] = (f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {PAGE_WIDTH} {PAGE_HEIGHT}] "
+                            f"/Resources << /Font << /F1 3 0 R >> /XObject << {xobjects} >> >> "
+                            f"/Contents {content_id} 0 R >>").encode()
+
+    kids = ' '.join(f"{page_id} 0 R" for page_id in page_ids)
+    objects[2] = f"<< /Type /Pages /Kids [{kids}] /Count {len(page_ids)} >>".encode()
+
+    out = io.BytesIO()
+    out.write(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+    offsets = {}
+    for obj_id in sorted(objects):
+        offsets[obj_id] = out.tell()
+        out.write(f"{obj_id} 0 obj\n".encode() + objects[obj_id] + b"\nendobj\n")
+    xref = out.tell()
+    out.write(f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode())
+    for obj_id in sorted(objects):
+        out.write(f"{offsets[obj_id]:010d} 00000 n \n".encode())
+    out.write(f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode())
+
+    tmp_path = path.with_suffix('.tmp')
+    tmp_path.write_bytes(out.getvalue())
+    os.replace(tmp_path, path)
+
+
+def generate_corpus(corpus_dir, issues, pages):
+    """Erzeugt (oder ergänzt) das Test-Archiv, gleiche Parameter ergeben immer dieselben Dateien"""
+    corpus_dir.mkdir(parents=True, exist_ok=True)
+    photos = _make_photos(random.Random(SEED))
+    day = date(2000, 1, 3)
+    created = 0
+    for issue_no in range(issues):
+        # Sonntage überspringen wie im echten Archiv
+        if day.weekday() == 6:
+            day += timedelta(days=1)
+        path = corpus_dir / f"{day.isoformat()}_Wormser_Zeitung.pdf"
+        if not path.exists():
+            write_issue(path, issue_no, pages, random.Random(SEED + issue_no), photos)
+            created += 1
+        day += timedelta(days=1)
+    logger.info(f"Test-Archiv {corpus_dir}: {issues} Ausgaben ({created} neu erzeugt)")
+    return sorted(corpus_dir.glob("*.pdf"))
+
+
+def _use_workdir(run_dir):
+    """Indexer auf ein eigenes Verzeichnis umbiegen (das echte Archiv bleibt unberührt)"""
+    if run_dir.exists():
+        shutil.rmtree(run_dir)
+    run_dir.mkdir(parents=True)
+    indexer.DB_PATH = run_dir / 'zeitung.db'
+    indexer.THUMB_DIR = run_dir / 'thumbnails'
+    indexer.PAGE_CACHE_DIR = run_dir / 'pages'
+    indexer.THUMB_DIR.mkdir()
+    indexer.PAGE_CACHE_DIR.mkdir()
+    # Gemessen wird die echte Suche, nicht der Cache
+    indexer.SEARCH_CACHE_SIZE = 0
+
+
+def _timed(func, *args, repeat=1, **kwargs):
+    runs = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args, **kwargs)
+        runs.append(time.perf_counter() - start)
+    return runs
+
+
+def _summary(runs, **extra):
+    return {'median': statistics.median(runs), 'min': min(runs), 'max': max(runs), 'runs': len(runs), **extra}
+
+
+def run_benchmarks(corpus, corpus_dir, work_dir, workers, sample, repeat):
+    results = {}
+
+    # index_pdf: einzelne Ausgaben in einen leeren Index
+    _use_workdir(work_dir / 'index_pdf')
+    indexer.init_db()
+    runs = []
+    for path in corpus[:sample]:
+        runs += _timed(indexer.index_pdf, path)
+    results['index_pdf'] = _summary(runs, unit='s/Ausgabe')
+
+    # rebuild_index: das komplette Archiv
+    _use_workdir(work_dir / 'rebuild')
+    results['rebuild_index'] = _summary(_timed(indexer.rebuild_index, corpus_dir, workers=workers),
+                                        unit='s', workers=workers or indexer.INDEX_WORKERS)
+
+    # Suche und Wochenansicht auf dem fertigen Index
+    for name, term in (('search_common', COMMON_TERM), ('search_rare', RARE_WORD)):
+        _, total = indexer.search_articles(term)
+        results[name] = _summary(_timed(indexer.search_articles, term, repeat=repeat), unit='s', hits=total)
+    weeks = indexer.get_available_weeks()
+    results['get_all_files_week'] = _summary(
+        _timed(indexer.get_all_files, corpus_dir, weeks[len(weeks) // 2] if weeks else None, repeat=repeat), unit='s')
+    results['get_all_files'] = _summary(_timed(indexer.get_all_files, corpus_dir, repeat=repeat), unit='s')
+
+    # Thumbnails (braucht poppler)
+    if shutil.which('pdftoppm'):
+        runs = []
+        for path in corpus[:max(1, sample // 4)]:
+            runs += _timed(indexer.generate_thumbnail, path)
+        results['generate_thumbnail'] = _summary(runs, unit='s/Ausgabe')
+    else:
+        logger.warning("pdftoppm fehlt, generate_thumbnail wird übersprungen.")
+
+    # Komprimierung (braucht Ghostscript), auf Kopien
+    if shutil.which('ghostscript'):
+        from compressor import compress_pdf
+        compress_dir = work_dir / 'compress'
+        compress_dir.mkdir(parents=True, exist_ok=True)
+        runs = []
+        for path in corpus[:max(1, sample // 8)]:
+            copy = compress_dir / path.name
+            shutil.copy2(path, copy)
+            runs += _timed(compress_pdf, copy, linearize=False)
+        results['compress_pdf'] = _summary(runs, unit='s/Ausgabe')
+    else:
+        logger.warning("Ghostscript fehlt, compress_pdf wird übersprungen.")
+
+    return results
+
+
+def _git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=Path(__file__).parent).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def compare(current, baseline, threshold):
+    """Vergleicht die Mediane, gibt die Liste der Verschlechterungen zurück"""
+    if (current['meta']['issues'], current['meta']['pages']) != (baseline['meta']['issues'], baseline['meta']['pages']):
+        logger.warning("Vergleichslauf hat ein anderes Test-Archiv, Zahlen nur bedingt vergleichbar.")
+    regressions = []
+    for name, result in current['results'].items():
+        old = baseline['results'].get(name)
+        if not old or not old['median']:
+            continue
+        ratio = result['median'] / old['median']
+        marker = ''
+        if ratio > 1 + threshold:
+            regressions.append(name)
+            marker = '  <-- LANGSAMER'
+        print(f"{name:22s} {old['median']:10.4f} -> {result['median']:10.4f}  ({ratio:5.2f}x){marker}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark für das Zeitungsarchiv")
+    parser.add_argument('--issues', type=int, default=100, choices=CORPUS_SIZES, help="Größe des Test-Archivs")
+    parser.add_argument('--pages', type=int, default=8, help="Seiten pro Ausgabe")
+    parser.add_argument('--workers', type=int, default=None, help="Worker für rebuild_index (Standard: INDEX_WORKERS)")
+    parser.add_argument('--sample', type=int, default=20, help="Anzahl Ausgaben für die Einzelmessungen")
+    parser.add_argument('--repeat', type=int, default=20, help="Wiederholungen für Suche und Wochenansicht")
+    parser.add_argument('--workdir', type=Path, default=Path('/tmp/zeitung-benchmark'),
+                        help="Hier liegen Test-Archiv und Test-Datenbanken")
+    parser.add_argument('--output', type=Path, default=None, help="JSON Datei (Standard: benchmark_results/...)")
+    parser.add_argument('--compare', type=Path, default=None, help="Früheres Ergebnis zum Vergleich")
+    parser.add_argument('--threshold', type=float, default=0.2, help="Ab wie viel langsamer (0.2 = 20%%) gemeldet wird")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    logging.getLogger('indexer').setLevel(logging.WARNING)
+
+    corpus_dir = args.workdir / f"corpus-{args.issues}x{args.pages}"
+    corpus = generate_corpus(corpus_dir, args.issues, args.pages)
+    results = run_benchmarks(corpus, corpus_dir, args.workdir / 'run', args.workers, args.sample, args.repeat)
+
+    report = {
+        'meta': {
+            'created': datetime.now().isoformat(timespec='seconds'),
+            'issues': args.issues,
+            'pages': args.pages,
+            'revision': _git_revision(),
+            'python': platform.python_version(),
+            'cpus': os.cpu_count(),
+        },
+        'results': results,
+    }
+    output = args.output or Path('benchmark_results') / f"{datetime.now():%Y%m%d-%H%M%S}_{args.issues}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2))
+    logger.info(f"Ergebnis gespeichert: {output}")
+
+    for name, result in results.items():
+        print(f"{name:22s} {result['median']:10.4f} {result['unit']}")
+
+    if args.compare:
+        regressions = compare(report, json.loads(args.compare.read_text()), args.threshold)
+        if regressions:
+            print(f"Verschlechtert: {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,10 +1,40 @@
 import subprocess
 import os
+import math
+import time
+import random
+import shutil
+import tempfile
 import logging
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
 from pathlib import Path
+from pypdf import PdfReader, PdfWriter
+
+import metrics
+from indexer import register_file, get_unlinearized_files, get_uncompressed_files, record_compression, \
+    get_file_flags, archive_lock
+from jobs import report_progress
 
 logger = logging.getLogger(__name__)
 
+# Nach der Komprimierung linearisieren ("Fast Web View": Seite 1 sofort im Browser sichtbar)
+LINEARIZE = os.getenv('COMPRESS_LINEARIZE', 'True').lower() == 'true'
+
+# Seiten-parallele Komprimierung großer Ausgaben
+COMPRESS_PARALLEL = os.getenv('COMPRESS_PARALLEL', 'True').lower() == 'true'
+COMPRESS_WORKERS = int(os.getenv('COMPRESS_WORKERS', os.cpu_count() or 1))
+COMPRESS_CHUNK_PAGES = int(os.getenv('COMPRESS_CHUNK_PAGES', '8'))
+
+# Massen-Komprimierung des Archivs: Anzahl Prozesse (mit niedriger CPU/IO Priorität)
+COMPRESS_BULK_WORKERS = int(os.getenv('COMPRESS_BULK_WORKERS', max((os.cpu_count() or 1) // 2, 1)))
+
+# Modus per Voranalyse vorhersagen statt immer erst Balanced zu versuchen
+COMPRESS_PREDICT = os.getenv('COMPRESS_PREDICT', 'True').lower() == 'true'
+# Balanced wird nur übersprungen, wenn die Prognose deutlich unter der 10%-Schwelle liegt
+PREDICT_AGGRESSIVE_BELOW = 5.0
+# Anteil der Dateien, bei denen Balanced trotz Prognose 'aggressive' läuft (Kontrolle der Heuristik)
+COMPRESS_PREDICT_AUDIT = float(os.getenv('COMPRESS_PREDICT_AUDIT', '0.1'))
+
 
 def run_ghostscript(input_path, output_path, quality_mode='balanced'):
     """
@@ -53,61 +83,450 @@ def run_ghostscript(input_path, output_path, quality_mode='balanced'):
     subprocess.run(cmd, check=True)
 
 
-def compress_pdf(input_path):
+def run_qpdf_linearize(input_path, output_path):
+    """Schreibt eine linearisierte Kopie (Bilder/Streams bleiben unverändert)"""
+    cmd = ['qpdf', '--linearize', str(input_path), str(output_path)]
+    result = subprocess.run(cmd, capture_output=True, text=True)
+    # qpdf Exit-Code 3 = Warnungen, Ausgabe ist trotzdem gültig
+    if result.returncode not in (0, 3):
+        raise subprocess.CalledProcessError(result.returncode, cmd, result.stdout, result.stderr)
+
+
+def _temp_file(input_path):
+    """
+    Eigene Temp-Datei pro Lauf im selben Ordner (für atomares os.replace).
+    Endet nicht auf .pdf, damit der Katalog-Abgleich sie nicht aufnimmt.
+    """
+    fd, name = tempfile.mkstemp(dir=input_path.parent, prefix=f".{input_path.stem}.", suffix='.tmp')
+    os.close(fd)
+    return Path(name)
+
+
+def _replace(temp_path, input_path):
+    """
+    Temp-Datei atomar an die Stelle des Originals setzen.
+    mkstemp legt Dateien mit 0600 an: Rechte des Originals übernehmen (Archiv liegt auf einer Freigabe).
+    """
+    shutil.copymode(input_path, temp_path)
+    os.replace(temp_path, input_path)
+
+
+def _linearize_temp(temp_path):
+    """Linearisiert die Temp-Datei an Ort und Stelle, gibt True bei Erfolg zurück"""
+    lin_path = temp_path.with_name(f"{temp_path.name}.lin")
+    try:
+        run_qpdf_linearize(temp_path, lin_path)
+        os.replace(lin_path, temp_path)
+        return True
+    except FileNotFoundError:
+        logger.warning("qpdf nicht installiert, Linearisierung übersprungen.")
+    except subprocess.CalledProcessError as e:
+        logger.error(f"qpdf Fehler: {e.stderr}")
+    if lin_path.exists():
+        os.remove(lin_path)
+    return False
+
+
+def linearize_pdf(input_path):
+    """
+    Linearisiert ein bestehendes PDF ohne neu zu komprimieren.
+    Gleicher Ablauf wie compress_pdf: Temp-Datei schreiben, dann austauschen.
+    """
+    input_path = Path(input_path)
+    with archive_lock(input_path):
+        if not input_path.exists():
+            logger.error(f"Datei nicht gefunden: {input_path}")
+            return False
+        # Wer auf die Sperre gewartet hat, findet die Datei evtl. schon linearisiert vor
+        flags = get_file_flags(input_path.name)
+        if flags and flags['linearized']:
+            logger.info(f"Bereits linearisiert: {input_path.name}")
+            return False
+
+        temp_path = _temp_file(input_path)
+        try:
+            shutil.copy2(input_path, temp_path)
+            if not _linearize_temp(temp_path):
+                return False
+            _replace(temp_path, input_path)
+            register_file(input_path, linearized=1)
+            logger.info(f"Linearisiert: {input_path.name}")
+            return True
+        except Exception as e:
+            logger.error(f"Fehler bei Linearisierung: {e}")
+            return False
+        finally:
+            if temp_path.exists():
+                os.remove(temp_path)
+
+
+def linearize_archive(base_dir):
+    """Batch: alle noch nicht linearisierten PDFs im Archiv linearisieren"""
+    done = 0
+    todo = get_unlinearized_files()
+    for number, filename in enumerate(todo, start=1):
+        report_progress(number - 1, len(todo), item=filename)
+        if linearize_pdf(Path(base_dir) / filename):
+            done += 1
+    report_progress(len(todo), len(todo))
+    logger.info(f"Linearisierung abgeschlossen: {done} Dateien.")
+    return done
+
+
+def _resolve(value):
+    return value.get_object() if hasattr(value, 'get_object') else value
+
+
+def _multiply(m1, m2):
+    """Produkt zweier PDF-Matrizen [a b c d e f] (m1 zuerst angewendet)"""
+    a1, b1, c1, d1, e1, f1 = m1
+    a2, b2, c2, d2, e2, f2 = m2
+    return [a1 * a2 + b1 * c2, a1 * b2 + b1 * d2,
+            c1 * a2 + d1 * c2, c1 * b2 + d1 * d2,
+            e1 * a2 + f1 * c2 + e2, e1 * b2 + f1 * d2 + f2]
+
+
+def _placed_widths(page):
+    """
+    Gezeichnete Breite (in Punkt) jedes per Do platzierten XObjects einer Seite,
+    berechnet aus der Transformationsmatrix (q/Q/cm). {name: größte Breite}
+    """
+    contents = page.get_contents()
+    if contents is None:
+        return {}
+    ctm = [1, 0, 0, 1, 0, 0]
+    stack = []
+    widths = {}
+    for operands, operator in contents.operations:
+        if operator == b'q':
+            stack.append(ctm)
+        elif operator == b'Q':
+            ctm = stack.pop() if stack else [1, 0, 0, 1, 0, 0]
+        elif operator == b'cm' and len(operands) == 6:
+            ctm = _multiply([float(x) for x in operands], ctm)
+        elif operator == b'Do' and operands:
+            # Ein Bild füllt das Einheitsquadrat, seine Breite ist die Länge des transformierten x-Vektors
+            width = math.hypot(ctm[0], ctm[1])
+            widths[operands[0]] = max(widths.get(operands[0], 0), width)
+    return widths
+
+
+def analyze_pdf(input_path, max_pages=8):
+    """
+    Günstige Voranalyse mit pypdf: Auflösung, Farbraum und Filter der eingebetteten Bilder.
+    Untersucht nur eine Stichprobe von max_pages Seiten.
+    """
+    pages = PdfReader(input_path).pages
+    page_count = len(pages)
+    step = max(page_count // max_pages, 1)
+    sample = [pages[i] for i in range(0, page_count, step)][:max_pages]
+
+    dpis = []
+    image_bytes = 0
+    dct = 0
+    cmyk = 0
+    for page in sample:
+        resources = _resolve(page.get('/Resources'))
+        xobjects = _resolve(resources.get('/XObject')) if resources else None
+        if not xobjects:
+            continue
+        # Nur tatsächlich gezeichnete Bilder, mit ihrer Größe auf der Seite
+        for name, placed_width in _placed_widths(page).items():
+            image = _resolve(xobjects.get(name))
+            if image is None or image.get('/Subtype') != '/Image' or not placed_width:
+                continue
+            dpis.append(int(_resolve(image.get('/Width', 0))) / (placed_width / 72))
+            # pypdf entfernt /Length beim Einlesen. JPEG reicht get_data() unverändert durch (= Größe in der Datei),
+            # andere Filter kommen entpackt zurück (Obergrenze, image_share wird ohnehin auf 1 begrenzt)
+            image_bytes += int(_resolve(image.get('/Length', 0))) or len(image.get_data())
+            if 'DCTDecode' in str(_resolve(image.get('/Filter'))):
+                dct += 1
+            if 'CMYK' in str(_resolve(image.get('/ColorSpace'))):
+                cmyk += 1
+
+    images = len(dpis)
+    return {
+        'pages': page_count,
+        'images': images,
+        'median_dpi': sorted(dpis)[images // 2] if images else 0,
+        # Hochgerechnet auf das ganze Dokument
+        'image_bytes': image_bytes * page_count / max(len(sample), 1),
+        'dct_share': dct / images if images else 0,
+        'cmyk_share': cmyk / images if images else 0,
+    }
+
+
+def predict_mode(analysis, original_size):
+    """
+    Sagt den passenden quality_mode und die erwartete Ersparnis in % voraus.
+    Aggressive nur, wenn Balanced deutlich unter der 10%-Schwelle bleiben würde
+    (PREDICT_AGGRESSIVE_BELOW), im Grenzbereich entscheidet der echte Balanced-Lauf.
+    """
+    if not analysis['images']:
+        # Nur Text/Vektoren: Ersparnis kommt aus Fonts, Downsampling bringt nichts
+        return 'balanced', 5.0
+
+    image_share = min(analysis['image_bytes'] / max(original_size, 1), 1)
+    dpi = analysis['median_dpi']
+    # Bereits JPEG in RGB: Neukodierung bringt wenig, CMYK->RGB und andere Filter mehr
+    recode = 0.9 if analysis['dct_share'] == 1 and not analysis['cmyk_share'] else 0.75
+
+    def estimate(target_dpi):
+        scale = min((target_dpi / dpi) ** 2, 1) if dpi else 1
+        return image_share * (1 - scale * recode) * 100
+
+    balanced = estimate(144)
+    if balanced >= PREDICT_AGGRESSIVE_BELOW:
+        return 'balanced', balanced
+    return 'aggressive', estimate(96)
+
+
+def _compress_two_pass(input_path, output_path, label, first_mode='balanced'):
+    """
+    Balanced (144dpi), bei weniger als 10% Ersparnis zusätzlich Aggressive (96dpi).
+    first_mode='aggressive' (Prognose): nur ein Durchlauf.
+    Gibt (neue Größe, verwendeter Modus, Anzahl Durchläufe, Größe nach Balanced oder None) zurück.
+    """
+    original_size = input_path.stat().st_size
+
+    if first_mode == 'aggressive':
+        logger.info(f"Starte Komprimierung (Aggressive/96dpi laut Prognose) für {label}...")
+        run_ghostscript(input_path, output_path, 'aggressive')
+        return output_path.stat().st_size, 'aggressive', 1, None
+
+    # --- VERSUCH 1: Balanced (144 DPI) ---
+    logger.info(f"Starte Komprimierung (Balanced/144dpi) für {label}...")
+    run_ghostscript(input_path, output_path, 'balanced')
+
+    new_size = output_path.stat().st_size
+    ratio = (1 - (new_size / original_size)) * 100
+
+    # Wenn weniger als 10% Ersparnis (oder Vergrößerung), versuche es härter
+    if new_size >= original_size or ratio < 10:
+        logger.info(f"Balanced brachte zu wenig ({ratio:.1f}%) oder Vergrößerung bei {label}. Starte Aggressive (96dpi)...")
+
+        # Temp Datei löschen für neuen Versuch
+        if output_path.exists():
+            os.remove(output_path)
+
+        # --- VERSUCH 2: Aggressive (96 DPI) ---
+        run_ghostscript(input_path, output_path, 'aggressive')
+        return output_path.stat().st_size, 'aggressive', 2, new_size
+
+    return new_size, 'balanced', 1, new_size
+
+
+def _predict(input_path):
+    """Prognose für eine Datei, None wenn deaktiviert oder Analyse fehlschlägt"""
+    if not COMPRESS_PREDICT:
+        return None, None
+    try:
+        return predict_mode(analyze_pdf(input_path), input_path.stat().st_size)
+    except Exception as e:
+        logger.warning(f"Analyse von {input_path.name} fehlgeschlagen: {e}")
+        return None, None
+
+
+def _first_mode(predicted_mode, label):
+    """Startmodus aus der Prognose, bei einer Stichprobe trotzdem erst Balanced (zur Kontrolle)"""
+    if predicted_mode == 'aggressive' and random.random() < COMPRESS_PREDICT_AUDIT:
+        logger.info(f"Stichprobe: {label} trotz Prognose erst mit Balanced")
+        return 'balanced'
+    return predicted_mode or 'balanced'
+
+
+def _compress_chunk(chunk_path):
+    """
+    Komprimiert einen Seitenblock (Modus per Prognose), behält das Original, falls das Ergebnis größer wird.
+    Gibt (pfad, modus, durchläufe, größe nach balanced oder None) zurück.
+    """
+    out_path = chunk_path.with_name(f"{chunk_path.stem}_gs.pdf")
+    mode, _ = _predict(chunk_path)
+    new_size, mode, passes, balanced_size = _compress_two_pass(chunk_path, out_path, chunk_path.name,
+                                                               _first_mode(mode, chunk_path.name))
+    if new_size < chunk_path.stat().st_size:
+        return out_path, mode, passes, balanced_size
+    os.remove(out_path)
+    return chunk_path, 'original', passes, balanced_size
+
+
+def compress_pdf_chunks(input_path, output_path, workers=None, chunk_pages=None):
+    """
+    Seiten-parallele Komprimierung: PDF in Seitenblöcke teilen, jeden Block in einem
+    eigenen Ghostscript-Prozess komprimieren (Modus pro Block) und wieder zusammenfügen.
+    Gibt (modus, anzahl ghostscript durchläufe, summe der größen nach balanced oder None) zurück.
+    """
+    workers = workers or COMPRESS_WORKERS
+    chunk_pages = chunk_pages or COMPRESS_CHUNK_PAGES
+
+    reader = PdfReader(input_path)
+    page_count = len(reader.pages)
+    chunk_dir = Path(tempfile.mkdtemp(prefix=f".{input_path.stem}_chunks_", dir=input_path.parent))
+    try:
+        # 1. Aufteilen
+        chunks = []
+        for first in range(0, page_count, chunk_pages):
+            writer = PdfWriter()
+            for page in reader.pages[first:first + chunk_pages]:
+                writer.add_page(page)
+            chunk_path = chunk_dir / f"chunk_{first // chunk_pages:04d}.pdf"
+            with open(chunk_path, 'wb') as f:
+                writer.write(f)
+            chunks.append(chunk_path)
+
+        # 2. Parallel komprimieren (jeder Block = eigener Ghostscript Prozess)
+        logger.info(f"Komprimiere {input_path.name} in {len(chunks)} Blöcken mit {workers} Prozessen...")
+        report_progress(0, len(chunks), item=input_path.name, force=True)
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            results = []
+            for result in pool.map(_compress_chunk, chunks):
+                results.append(result)
+                report_progress(len(results), item=input_path.name)
+
+        # 3. Zusammenfügen
+        merger = PdfWriter()
+        for part, _, _, _ in results:
+            merger.append(str(part))
+        with open(output_path, 'wb') as f:
+            merger.write(f)
+
+        # Ergebnis muss ein gültiges PDF mit gleicher Seitenzahl sein
+        merged_pages = len(PdfReader(output_path).pages)
+        if merged_pages != page_count:
+            raise ValueError(f"Seitenzahl nach Zusammenfügen falsch ({merged_pages} statt {page_count})")
+
+        modes = {mode for _, mode, _, _ in results}
+        balanced_sizes = [size for _, _, _, size in results]
+        balanced_size = None if None in balanced_sizes else sum(balanced_sizes)
+        return ('mixed' if len(modes) > 1 else modes.pop(), sum(passes for _, _, passes, _ in results),
+                balanced_size)
+    finally:
+        shutil.rmtree(chunk_dir, ignore_errors=True)
+
+
+def compress_pdf(input_path, linearize=None, parallel=None, force=False):
     """
     Versucht ein PDF intelligent zu komprimieren.
     Strategie: Erst moderat (144dpi), wenn das nichts bringt -> aggressiv (96dpi).
+    linearize: Ergebnis zusätzlich linearisieren (Standard: COMPRESS_LINEARIZE)
+    parallel: große Ausgaben seitenweise parallel komprimieren (Standard: COMPRESS_PARALLEL)
+    force: auch bereits komprimierte Ausgaben erneut komprimieren (manueller Aufruf)
     """
     input_path = Path(input_path)
-    if not input_path.exists():
-        logger.error(f"Datei nicht gefunden: {input_path}")
-        return False
+    # Pipeline, Massen-Komprimierung, Linearisierung und manuelle Jobs können dieselbe Datei erwischen
+    with archive_lock(input_path):
+        if not input_path.exists():
+            logger.error(f"Datei nicht gefunden: {input_path}")
+            return False
+        flags = get_file_flags(input_path.name)
+        if not force and flags and flags['compressed']:
+            # Verlustbehaftet: nie zweimal automatisch komprimieren
+            logger.info(f"Bereits komprimiert, übersprungen: {input_path.name}")
+            return False
+        return _compress_locked(input_path, linearize, parallel)
 
-    temp_path = input_path.with_name(f"{input_path.stem}_temp.pdf")
+
+def _compress_locked(input_path, linearize=None, parallel=None):
+    if linearize is None:
+        linearize = LINEARIZE
+    if parallel is None:
+        parallel = COMPRESS_PARALLEL
+
+    temp_path = _temp_file(input_path)
     original_size = input_path.stat().st_size
+    started = time.monotonic()
 
     try:
-        # --- VERSUCH 1: Balanced (144 DPI) ---
-        logger.info(f"Starte Komprimierung (Balanced/144dpi) für {input_path.name}...")
-        run_ghostscript(input_path, temp_path, 'balanced')
-
+        predicted_mode, predicted_savings = _predict(input_path)
+        page_count = len(PdfReader(input_path).pages) if parallel else 0
+        if parallel and COMPRESS_WORKERS > 1 and page_count >= 2 * COMPRESS_CHUNK_PAGES:
+            # Prognose erfolgt hier pro Block
+            actual_mode, passes, balanced_size = compress_pdf_chunks(input_path, temp_path)
+        else:
+            _, actual_mode, passes, balanced_size = _compress_two_pass(
+                input_path, temp_path, input_path.name, _first_mode(predicted_mode, input_path.name))
         new_size = temp_path.stat().st_size
         ratio = (1 - (new_size / original_size)) * 100
 
-        # Wenn weniger als 10% Ersparnis (oder Vergrößerung), versuche es härter
-        if new_size >= original_size or ratio < 10:
-            logger.info(f"Balanced brachte zu wenig ({ratio:.1f}%) oder Vergrößerung. Starte Aggressive (96dpi)...")
-
-            # Temp Datei löschen für neuen Versuch
-            if temp_path.exists():
-                os.remove(temp_path)
-
-            # --- VERSUCH 2: Aggressive (96 DPI) ---
-            run_ghostscript(input_path, temp_path, 'aggressive')
-            new_size = temp_path.stat().st_size
-            ratio = (1 - (new_size / original_size)) * 100
+        if predicted_mode:
+            logger.info(f"Prognose: {predicted_mode} (~{predicted_savings:.1f}%), "
+                        f"tatsächlich: {actual_mode} ({ratio:.1f}%, {passes} Durchläufe)")
+        duration = time.monotonic() - started
+        record_compression(input_path.name, predicted_mode=predicted_mode, predicted_savings=predicted_savings,
+                           actual_mode=actual_mode, original_size=original_size, new_size=new_size,
+                           balanced_size=balanced_size, passes=passes, duration=duration)
+        metrics.COMPRESS_SECONDS.labels(mode=actual_mode).observe(duration)
+        metrics.COMPRESS_SAVINGS.labels(mode=actual_mode).observe(max(0.0, ratio / 100))
 
         # Finale Auswertung
         if new_size < original_size:
             logger.info(
                 f"Optimierung erfolgreich: {original_size / 1024 / 1024:.2f}MB -> {new_size / 1024 / 1024:.2f}MB (-{ratio:.1f}%)")
-            os.remove(input_path)
-            os.rename(temp_path, input_path)
+            linearized = linearize and _linearize_temp(temp_path)
+            # Atomar austauschen: das Original bleibt bis zum letzten Moment vollständig
+            _replace(temp_path, input_path)
+            register_file(input_path, linearized=int(linearized), compressed=1)
             return True
         else:
             logger.info(
                 f"Keine Optimierung möglich (Datei wächst auf {new_size / 1024 / 1024:.2f}MB). Behalte Original.")
-            if temp_path.exists():
-                os.remove(temp_path)
+            # Trotzdem als erledigt merken, damit die Massen-Komprimierung sie nicht erneut versucht
+            register_file(input_path, compressed=1)
             return False
 
     except subprocess.CalledProcessError as e:
         logger.error(f"Ghostscript Fehler: {e}")
-        if temp_path.exists():
-            os.remove(temp_path)
         return False
     except Exception as e:
         logger.error(f"Fehler bei Komprimierung: {e}")
+        return False
+    finally:
         if temp_path.exists():
             os.remove(temp_path)
-        return False
\ No newline at end of file
+
+
+def _lower_priority():
+    """Initializer für die Pool-Prozesse: niedrige CPU- und IO-Priorität (vererbt an Ghostscript)"""
+    try:
+        os.nice(10)
+        subprocess.run(['ionice', '-c', '3', '-p', str(os.getpid())], check=False, capture_output=True)
+    except Exception:
+        pass
+
+
+def _compress_archive_file(path):
+    """Pool-Worker: eine Datei komprimieren, gibt (name, größe vorher, größe nachher) zurück"""
+    before = path.stat().st_size
+    compress_pdf(path, parallel=False)
+    return path.name, before, path.stat().st_size
+
+
+def compress_archive(base_dir, workers=None):
+    """
+    Komprimiert alle Ausgaben, die noch nicht komprimiert wurden.
+    Der Fortschritt steht im Katalog (files.compressed), ein Neustart macht also dort weiter.
+    Gibt die insgesamt gesparten Bytes zurück.
+    """
+    workers = workers or COMPRESS_BULK_WORKERS
+    todo = [Path(base_dir) / name for name in get_uncompressed_files()]
+    todo = [path for path in todo if path.exists()]
+    logger.info(f"Massen-Komprimierung: {len(todo)} Dateien offen, {workers} Prozesse")
+
+    saved = 0
+    done = 0
+    report_progress(0, len(todo), force=True)
+    with ProcessPoolExecutor(max_workers=workers, initializer=_lower_priority) as pool:
+        futures = [pool.submit(_compress_archive_file, path) for path in todo]
+        for future in as_completed(futures):
+            try:
+                name, before, after = future.result()
+                saved += before - after
+                done += 1
+                report_progress(done, item=name)
+                logger.info(f"Massen-Komprimierung {done}/{len(todo)}: {name} "
+                            f"(bisher {saved / 1024 / 1024:.1f}MB gespart)")
+            except Exception as e:
+                logger.error(f"Massen-Komprimierung Fehler: {e}")
+
+    logger.info(f"Massen-Komprimierung fertig: {done} Dateien, {saved / 1024 / 1024:.1f}MB gespart.")
+    return saved
@@ -0,0 +1,18 @@
+import os
+import shutil
+
+
+def on_starting(server):
+    """Metrik-Dateien eines früheren Laufs entfernen (Prometheus Multiprozess-Modus)"""
+    metrics_dir = os.getenv('PROMETHEUS_MULTIPROC_DIR')
+    if metrics_dir:
+        shutil.rmtree(metrics_dir, ignore_errors=True)
+        os.makedirs(metrics_dir, exist_ok=True)
+
+
+def child_exit(server, worker):
+    try:
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
+    except ImportError:
+        pass
@@ -1,31 +1,184 @@
 import sqlite3
 import os
+import fcntl
+import hashlib
+import json
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
 from pathlib import Path
 from pypdf import PdfReader
 import logging
 from datetime import datetime
 from pdf2image import convert_from_path
 
+import metrics
+import profiling
+
 # Datenbank Datei
 DB_PATH = Path('/app/downloads/zeitung.db')
 THUMB_DIR = Path('/app/downloads/thumbnails')
+PAGE_CACHE_DIR = Path('/app/downloads/pages')
+
+# Parallelisierung für rebuild_index (1 = seriell wie bisher)
+INDEX_WORKERS = int(os.getenv('INDEX_WORKERS', os.cpu_count() or 1))
+# Anzahl Dateien pro DB-Transaktion beim Rebuild
+INDEX_BATCH_SIZE = int(os.getenv('INDEX_BATCH_SIZE', '20'))
+# Treffer pro Ergebnisseite der Suche
+SEARCH_PAGE_SIZE = int(os.getenv('SEARCH_PAGE_SIZE', '48'))
+# Maximale Anzahl gecachter Suchergebnisse (0 = Cache aus)
+SEARCH_CACHE_SIZE = int(os.getenv('SEARCH_CACHE_SIZE', '500'))
+# Ein Tag gilt erst als 'keine Ausgabe', wenn er bei der Prüfung so viele Tage zurücklag
+# (vorher steht die Ausgabe evtl. nur noch nicht im Regal)
+NO_ISSUE_MIN_AGE_DAYS = 3
+# Danach wird ein als 'keine Ausgabe' gemerkter Tag beim nächsten Lücken füllen erneut geprüft
+NO_ISSUE_TTL_DAYS = 90
+# Zugriffszeit eines Cache-Eintrags höchstens so oft (Sekunden) schreiben, nicht bei jedem Treffer
+SEARCH_CACHE_TOUCH_INTERVAL = 60
+# Cache-Schreibzugriffe warten höchstens so lange (ms) auf eine Sperre, die Suche geht vor
+SEARCH_CACHE_WRITE_TIMEOUT_MS = 200
+# Index-Schreibzugriffe (auch aus Pool-Prozessen) warten so lange (s) auf die Schreibsperre
+INDEX_WRITE_TIMEOUT = 60
+
+# Thumbnail Breiten in Pixel: klein für das Kachel-Grid, groß für das Vorschau-Modal
+THUMB_SIZES = {
+    'small': int(os.getenv('THUMB_WIDTH_SMALL', '400')),
+    'large': int(os.getenv('THUMB_WIDTH_LARGE', '1400')),
+}
+# 'webp' oder 'jpeg'
+THUMB_FORMAT = os.getenv('THUMB_FORMAT', 'webp').lower()
+# Thumbnails schon beim Indexieren erzeugen? Sonst erst beim ersten Abruf (/thumbnail)
+THUMBS_ON_INDEX = os.getenv('THUMBS_ON_INDEX', 'False').lower() == 'true'
+
+# Seiten-Renderer (/page): erlaubte Breiten (Anfragen werden aufgerundet) und Cache-Größe
+PAGE_WIDTHS = (600, 900, 1200, 1600, 2000)
+PAGE_CACHE_MAX_MB = int(os.getenv('PAGE_CACHE_MAX_MB', '1024'))
 
 logger = logging.getLogger(__name__)
 
-# Sicherstellen, dass Thumbnail Ordner existiert
-THUMB_DIR.mkdir(parents=True, exist_ok=True)
+
+def _add_column(c, table, column, definition):
+    """Spalte nachrüsten, falls die Tabelle aus einer älteren Version stammt"""
+    c.execute(f"PRAGMA table_info({table})")
+    if column not in {row[1] for row in c.fetchall()}:
+        c.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
 
 
 def init_db():
+    # Ordner erst hier anlegen, nicht schon beim Import (Tests, Benchmark und Werkzeuge biegen die Pfade um)
+    for directory in (DB_PATH.parent, THUMB_DIR, PAGE_CACHE_DIR):
+        directory.mkdir(parents=True, exist_ok=True)
     conn = sqlite3.connect(DB_PATH)
     c = conn.cursor()
+    # WAL: Lesen (Suche, Wochenansicht) wird nicht von Schreibzugriffen der Jobs blockiert.
+    # Der Modus wird in der Datei gespeichert und gilt für alle Verbindungen.
+    c.execute("PRAGMA journal_mode=WAL")
+
+    # Alter Index (eine Zeile pro Ausgabe) -> wird verworfen und seitenweise neu aufgebaut
+    c.execute("SELECT name FROM sqlite_master WHERE name IN ('articles', 'pages')")
+    existing = {row[0] for row in c.fetchall()}
+    if 'articles' in existing and 'pages' not in existing:
+        logger.warning("Alter Suchindex gefunden, wird seitenweise neu aufgebaut.")
+        c.execute("DROP TABLE articles")
+        c.execute("DROP TABLE IF EXISTS manifest")
+
+    # Eine Zeile pro Seite, der FTS Index liest den Inhalt aus dieser Tabelle
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS pages (
+            id INTEGER PRIMARY KEY,
+            filename TEXT,
+            date TEXT,
+            page INTEGER,
+            content TEXT
+        )
+    ''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_pages_filename ON pages(filename)")
     c.execute('''
         CREATE VIRTUAL TABLE IF NOT EXISTS articles 
-        USING fts5(filename, date, content)
+        USING fts5(filename UNINDEXED, date UNINDEXED, page UNINDEXED, content,
+                   content='pages', content_rowid='id')
+    ''')
+    # Trigger halten den FTS Index synchron zur pages Tabelle
+    c.execute('''
+        CREATE TRIGGER IF NOT EXISTS pages_ai AFTER INSERT ON pages BEGIN
+            INSERT INTO articles (rowid, filename, date, page, content)
+            VALUES (new.id, new.filename, new.date, new.page, new.content);
+        END
+    ''')
+    c.execute('''
+        CREATE TRIGGER IF NOT EXISTS pages_ad AFTER DELETE ON pages BEGIN
+            INSERT INTO articles (articles, rowid, filename, date, page, content)
+            VALUES ('delete', old.id, old.filename, old.date, old.page, old.content);
+        END
+    ''')
+    # Manifest: Stand jeder Datei beim letzten Indexieren (für inkrementelles Reindex)
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS manifest (
+            filename TEXT PRIMARY KEY,
+            size INTEGER,
+            mtime REAL,
+            hash TEXT
+        )
+    ''')
+    # Katalog aller Ausgaben für die Wochenansicht (ersetzt den Verzeichnis-Scan pro Request)
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS files (
+            filename TEXT PRIMARY KEY,
+            date TEXT,
+            week_id TEXT,
+            size INTEGER,
+            pages INTEGER,
+            indexed INTEGER DEFAULT 0,
+            thumb TEXT DEFAULT 'missing',
+            linearized INTEGER DEFAULT 0,
+            compressed INTEGER DEFAULT 0
+        )
+    ''')
+    _add_column(c, 'files', 'linearized', 'INTEGER DEFAULT 0')
+    _add_column(c, 'files', 'compressed', 'INTEGER DEFAULT 0')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_files_week ON files(week_id, filename)")
+    # Statistik pro Komprimierung (Prognose vs. Ergebnis) zur Auswertung der Heuristik
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS compression_stats (
+            id INTEGER PRIMARY KEY,
+            filename TEXT,
+            created TEXT DEFAULT CURRENT_TIMESTAMP,
+            predicted_mode TEXT,
+            predicted_savings REAL,
+            actual_mode TEXT,
+            original_size INTEGER,
+            new_size INTEGER,
+            balanced_size INTEGER,
+            passes INTEGER,
+            duration REAL
+        )
     ''')
+    # Größe nach dem Balanced-Lauf (auch wenn danach Aggressive nötig war), None = nicht gelaufen
+    _add_column(c, 'compression_stats', 'balanced_size', 'INTEGER')
+    # Tage, an denen laut Anbieter keine Ausgabe erschienen ist (spart erneute Versuche beim Lücken füllen)
+    c.execute("CREATE TABLE IF NOT EXISTS no_issue_dates (date TEXT PRIMARY KEY, checked TEXT DEFAULT CURRENT_TIMESTAMP)")
+    # Zähler, der bei jeder Index-Änderung erhöht wird (macht Such-Cache ungültig)
+    c.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER)")
+    c.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('index_generation', 0)")
+    # Such-Cache, geteilt zwischen allen Gunicorn Workern
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS search_cache (
+            key TEXT PRIMARY KEY,
+            generation INTEGER,
+            payload TEXT,
+            last_used REAL
+        )
+    ''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_search_cache_used ON search_cache(last_used)")
     conn.commit()
+    c.execute("SELECT COUNT(*) FROM files")
+    catalog_empty = c.fetchone()[0] == 0
     conn.close()
 
+    # Erster Start mit Katalog: einmalig aus dem Verzeichnis befüllen
+    if catalog_empty:
+        sync_catalog(DB_PATH.parent)
+
 
 def format_german_date(date_str):
     """Wandelt 2026-01-30 in 'Freitag, 30. Januar 2026' um"""
@@ -39,190 +192,780 @@ def format_german_date(date_str):
         return date_str
 
 
+def thumbnail_path(filename, size='small'):
+    """Pfad des Thumbnails einer Ausgabe in der gewünschten Größe"""
+    ext = 'webp' if THUMB_FORMAT == 'webp' else 'jpg'
+    return THUMB_DIR / f"{Path(filename).stem}_{size}.{ext}"
+
+
+def _save_image(image, path):
+    # Erst temporär schreiben, dann umbenennen: nie halbe Dateien ausliefern
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f".{path.name}.tmp")
+    if THUMB_FORMAT == 'webp':
+        image.save(tmp_path, 'WEBP', quality=75, method=4)
+    else:
+        image.convert('RGB').save(tmp_path, 'JPEG', quality=75, optimize=True, progressive=True)
+    os.replace(tmp_path, path)
+
+
 def generate_thumbnail(pdf_path):
-    """Erstellt ein JPG Thumbnail der ersten Seite"""
+    """Erstellt Thumbnails (klein + groß) der ersten Seite, gibt den Status ('ok'/'error') zurück"""
     try:
-        thumb_filename = f"{pdf_path.stem}.jpg"
-        thumb_path = THUMB_DIR / thumb_filename
+        small_path = thumbnail_path(pdf_path.name, 'small')
+        large_path = thumbnail_path(pdf_path.name, 'large')
 
-        # Wenn Thumbnail schon existiert, überspringen
-        if thumb_path.exists():
-            return
+        # Wenn Thumbnails schon existieren, überspringen
+        if small_path.exists() and large_path.exists():
+            return 'ok'
 
-        # Nur erste Seite konvertieren, 200dpi reicht für Thumbnails
-        images = convert_from_path(str(pdf_path), first_page=1, last_page=1, dpi=200)
+        # Nur erste Seite, poppler rendert direkt in Zielbreite (-scale-to) statt voller DPI
+        images = convert_from_path(str(pdf_path), first_page=1, last_page=1,
+                                   size=(THUMB_SIZES['large'], None))
         if images:
-            images[0].save(thumb_path, 'JPEG', quality=80)
-            logger.info(f"Thumbnail erstellt: {thumb_filename}")
+            image = images[0]
+            _save_image(image, large_path)
+            # Kleines Thumbnail aus dem großen herunterskalieren (kein zweiter Render)
+            small = image.copy()
+            small.thumbnail((THUMB_SIZES['small'], THUMB_SIZES['small'] * 10))
+            _save_image(small, small_path)
+            logger.info(f"Thumbnail erstellt: {small_path.name}")
+            return 'ok'
 
     except Exception as e:
         logger.error(f"Thumbnail Fehler für {pdf_path.name}: {e}")
+    return 'error'
 
 
-def index_pdf(filepath):
-    filename = filepath.name
+@contextmanager
+def _flock(lock_path):
+    """Prozessübergreifende Sperre (flock) über eine Sperrdatei"""
+    lock_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(lock_path, 'w') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def render_lock(name, directory=None):
+    """Sperre, damit jedes Bild nur einmal gerendert wird (Sperrdatei im Cache-Ordner des Bildes)"""
+    return _flock((directory or THUMB_DIR) / '.locks' / f"{name}.lock")
+
+
+def archive_lock(pdf_path):
+    """
+    Sperre pro Ausgabe für alles, was die PDF an Ort und Stelle umschreibt
+    (Komprimierung, Linearisierung, Massen-Komprimierung, Pipeline).
+    """
+    return _flock(pdf_path.parent / '.locks' / f"{pdf_path.stem}.lock")
+
+
+def ensure_thumbnail(pdf_path):
+    """
+    Thumbnail bei Bedarf erzeugen (erster Abruf im Browser).
+    Gleichzeitige Anfragen für dieselbe Datei - auch aus anderen Gunicorn Workern -
+    warten per Dateisperre auf einen einzigen Render.
+    """
+    if thumbnail_path(pdf_path.name, 'small').exists() and thumbnail_path(pdf_path.name, 'large').exists():
+        return 'ok'
+    if not pdf_path.exists():
+        return 'error'
+
+    with render_lock(pdf_path.stem):
+        # Prüft erneut: wer auf die Sperre gewartet hat, findet das fertige Bild vor
+        state = generate_thumbnail(pdf_path)
+
     try:
-        date_str = filename.split('_')[0]
-    except:
-        date_str = "0000-00-00"
+        conn = sqlite3.connect(DB_PATH)
+        conn.execute("UPDATE files SET thumb = ? WHERE filename = ?", (state, pdf_path.name))
+        conn.commit()
+        conn.close()
+    except Exception as e:
+        logger.error(f"Katalog Fehler für {pdf_path.name}: {e}")
+    return state
 
-    # 1. Thumbnail generieren (unabhängig von DB)
-    generate_thumbnail(filepath)
 
+def get_page_count(pdf_path):
+    """Seitenzahl aus dem Katalog, sonst einmal aus dem PDF lesen und merken"""
     conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-
-    c.execute("SELECT rowid FROM articles WHERE filename = ?", (filename,))
-    if c.fetchone():
+    row = conn.execute("SELECT pages FROM files WHERE filename = ?", (pdf_path.name,)).fetchone()
+    if row and row[0]:
         conn.close()
+        return row[0]
+    try:
+        count = len(PdfReader(pdf_path).pages)
+        conn.execute("UPDATE files SET pages = ? WHERE filename = ?", (count, pdf_path.name))
+        conn.commit()
+    except Exception as e:
+        logger.error(f"Seitenzahl nicht lesbar für {pdf_path.name}: {e}")
+        count = 0
+    conn.close()
+    return count
+
+
+def render_page(pdf_path, page, width):
+    """
+    Rendert eine einzelne Seite als Bild (für den Seiten-Viewer) und legt sie im Cache ab.
+    Gibt den Pfad zum Bild zurück, None bei Fehler.
+    """
+    # Auf feste Stufen runden, damit der Cache nicht für jede Fensterbreite wächst
+    width = next((w for w in PAGE_WIDTHS if w >= width), PAGE_WIDTHS[-1])
+    ext = 'webp' if THUMB_FORMAT == 'webp' else 'jpg'
+    page_path = PAGE_CACHE_DIR / f"{pdf_path.stem}_p{page}_w{width}.{ext}"
+
+    if page_path.exists():
+        try:
+            # Zugriffszeit merken (LRU)
+            os.utime(page_path)
+            return page_path
+        except FileNotFoundError:
+            # Zwischen exists() und utime() vom Aufräumen (anderer Worker) gelöscht: neu rendern
+            pass
+
+    with render_lock(page_path.stem, PAGE_CACHE_DIR):
+        if not page_path.exists():
+            try:
+                images = convert_from_path(str(pdf_path), first_page=page, last_page=page, size=(width, None))
+                if not images:
+                    return None
+                _save_image(images[0], page_path)
+            except Exception as e:
+                logger.error(f"Seite {page} von {pdf_path.name} nicht renderbar: {e}")
+                return None
+    prune_page_cache()
+    return page_path
+
+
+def prune_page_cache():
+    """Löscht die am längsten nicht genutzten Seitenbilder, wenn der Cache zu groß wird"""
+    entries = []
+    total = 0
+    with os.scandir(PAGE_CACHE_DIR) as it:
+        for entry in it:
+            if entry.is_file() and not entry.name.startswith('.'):
+                st = entry.stat()
+                entries.append((st.st_mtime, st.st_size, entry.path))
+                total += st.st_size
+
+    limit = PAGE_CACHE_MAX_MB * 1024 * 1024
+    if total <= limit:
         return
+    # Auf 90% des Limits herunter, damit nicht bei jedem Render geräumt wird
+    lock_dir = PAGE_CACHE_DIR / '.locks'
+    for _, size, path in sorted(entries):
+        try:
+            os.remove(path)
+            total -= size
+            # Sperrdatei des Bildes gleich mit entfernen
+            (lock_dir / f"{Path(path).stem}.lock").unlink(missing_ok=True)
+        except OSError:
+            pass
+        if total <= limit * 0.9:
+            break
+
+
+def date_from_filename(filename):
+    try:
+        return filename.split('_')[0]
+    except:
+        return "0000-00-00"
+
 
+def week_from_date(date_str):
+    """2026-01-30 -> 2026-W05"""
     try:
-        logger.info(f"Indiziere: {filename} ...")
-        reader = PdfReader(filepath)
-        text = ""
-        for page in reader.pages:
-            extract = page.extract_text()
-            if extract:
-                text += extract + " "
-
-        c.execute("INSERT INTO articles (filename, date, content) VALUES (?, ?, ?)",
-                  (filename, date_str, text))
+        year, week, _ = datetime.strptime(date_str, '%Y-%m-%d').isocalendar()
+        return f"{year}-W{week:02d}"
+    except:
+        return "Unknown"
+
+
+def _upsert_file(conn, filename, size, **fields):
+    """
+    Legt einen Katalog-Eintrag an bzw. aktualisiert ihn.
+    fields: weitere Spalten (pages, indexed, thumb, linearized, compressed), None = Feld unverändert lassen
+    """
+    fields = {key: value for key, value in fields.items() if value is not None}
+    date_str = date_from_filename(filename)
+    columns = ['filename', 'date', 'week_id', 'size', *fields]
+    updates = ', '.join(f"{key} = excluded.{key}" for key in ['size', *fields])
+    conn.execute(f'''
+        INSERT INTO files ({', '.join(columns)})
+        VALUES ({', '.join('?' * len(columns))})
+        ON CONFLICT(filename) DO UPDATE SET {updates}
+    ''', (filename, date_str, week_from_date(date_str), size, *fields.values()))
+
+
+def bump_generation(conn):
+    """Index hat sich geändert: alle gecachten Suchergebnisse werden ungültig"""
+    conn.execute("UPDATE meta SET value = value + 1 WHERE key = 'index_generation'")
+    conn.execute("DELETE FROM search_cache")
+
+
+def _cache_get(conn, key):
+    row = conn.execute('''
+        SELECT c.payload, c.last_used FROM search_cache c
+        JOIN meta m ON m.key = 'index_generation' AND m.value = c.generation
+        WHERE c.key = ?
+    ''', (key,)).fetchone()
+    if row is None:
+        return None
+    # LRU reicht minutengenau: nur selten schreiben, ein Cache-Treffer soll keine Sperre brauchen
+    now = time.time()
+    if now - (row[1] or 0) > SEARCH_CACHE_TOUCH_INTERVAL:
+        try:
+            conn.execute(f"PRAGMA busy_timeout = {SEARCH_CACHE_WRITE_TIMEOUT_MS}")
+            conn.execute("UPDATE search_cache SET last_used = ? WHERE key = ?", (now, key))
+            conn.commit()
+        except sqlite3.Error as e:
+            conn.rollback()
+            logger.debug(f"Such-Cache: Zugriffszeit nicht gespeichert: {e}")
+    return json.loads(row[0])
+
+
+def _cache_put(conn, key, value):
+    conn.execute(f"PRAGMA busy_timeout = {SEARCH_CACHE_WRITE_TIMEOUT_MS}")
+    conn.execute('''
+        INSERT OR REPLACE INTO search_cache (key, generation, payload, last_used)
+        SELECT ?, value, ?, ? FROM meta WHERE key = 'index_generation'
+    ''', (key, json.dumps(value), time.time()))
+    # LRU: älteste Einträge über dem Limit verwerfen
+    conn.execute('''
+        DELETE FROM search_cache WHERE key IN (
+            SELECT key FROM search_cache ORDER BY last_used DESC LIMIT -1 OFFSET ?
+        )
+    ''', (SEARCH_CACHE_SIZE,))
+    conn.commit()
+
+
+def record_compression(filename, **stats):
+    """Speichert das Ergebnis einer Komprimierung (Spalten siehe compression_stats)"""
+    try:
+        conn = sqlite3.connect(DB_PATH)
+        conn.execute(f"INSERT INTO compression_stats (filename, {', '.join(stats)}) "
+                     f"VALUES (?, {', '.join('?' * len(stats))})", (filename, *stats.values()))
         conn.commit()
-        logger.info(f"Erfolgreich indexiert: {filename}")
+        conn.close()
     except Exception as e:
-        logger.error(f"Fehler beim Lesen von {filename}: {e}")
-    finally:
+        logger.error(f"Statistik Fehler für {filename}: {e}")
+
+
+def register_file(filepath, **fields):
+    """
+    Nimmt eine (neue oder geänderte) Datei in den Katalog auf.
+    Wird vom Scraper, Kompressor und Indexer aufgerufen.
+    """
+    try:
+        conn = sqlite3.connect(DB_PATH)
+        _upsert_file(conn, filepath.name, filepath.stat().st_size, **fields)
+        bump_generation(conn)
+        conn.commit()
+        conn.close()
+    except Exception as e:
+        logger.error(f"Katalog Fehler für {filepath.name}: {e}")
+
+
+def sync_catalog(base_dir, on_disk=None):
+    """
+    Gleicht den Katalog mit dem Verzeichnis ab.
+    on_disk: optional bereits gelesenes {filename: (size, mtime)}
+    """
+    if on_disk is None:
+        on_disk = {}
+        if base_dir.exists():
+            with os.scandir(base_dir) as it:
+                for entry in it:
+                    if entry.name.endswith('.pdf') and entry.is_file():
+                        st = entry.stat()
+                        on_disk[entry.name] = (st.st_size, st.st_mtime)
+
+    conn = sqlite3.connect(DB_PATH)
+    catalog = {row[0]: row[1] for row in conn.execute("SELECT filename, size FROM files")}
+    indexed = {row[0] for row in conn.execute("SELECT filename FROM manifest")}
+
+    changed = 0
+    for name, (size, _) in on_disk.items():
+        if catalog.get(name) != size:
+            thumb = 'ok' if thumbnail_path(name).exists() else None
+            _upsert_file(conn, name, size, indexed=int(name in indexed), thumb=thumb)
+            changed += 1
+    removed = [name for name in catalog if name not in on_disk]
+    conn.executemany("DELETE FROM files WHERE filename = ?", [(name,) for name in removed])
+    if changed or removed:
+        bump_generation(conn)
+    conn.commit()
+    conn.close()
+
+    if changed or removed:
+        logger.info(f"Katalog abgeglichen: {changed} aktualisiert, {len(removed)} entfernt.")
+
+
+def extract_pages(filepath):
+    """Liest den Text eines PDFs seitenweise (ohne DB Zugriff): ([(seite, text), ...], seitenzahl)"""
+    reader = PdfReader(filepath)
+    pages = []
+    for number, page in enumerate(reader.pages, start=1):
+        extract = page.extract_text()
+        if extract and extract.strip():
+            pages.append((number, extract))
+    return pages, len(reader.pages)
+
+
+def file_hash(filepath):
+    """SHA-256 über den Dateiinhalt (blockweise gelesen)"""
+    h = hashlib.sha256()
+    with open(filepath, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+def index_pdf(filepath):
+    """Einzelne Ausgabe indexieren. False, wenn PDF oder Datenbank-Schreiben fehlschlug"""
+    filename = filepath.name
+
+    conn = sqlite3.connect(DB_PATH)
+    c = conn.cursor()
+
+    c.execute("SELECT 1 FROM manifest WHERE filename = ?", (filename,))
+    if c.fetchone():
         conn.close()
+        # Bereits indexiert, nur ggf. fehlendes Thumbnail nachholen
+        if THUMBS_ON_INDEX:
+            generate_thumbnail(filepath)
+        return True
+    conn.close()
+
+    logger.info(f"Indiziere: {filename} ...")
+    result = process_pdf(filepath)
+    return _write_batch([result]) and result['ok']
 
 
-def search_articles(query):
+def search_articles(query, limit=None, offset=0, sort='date'):
+    """
+    Volltextsuche, eine Zeile pro Treffer-Seite.
+    sort: 'date' (neueste zuerst) oder 'relevance' (BM25)
+    Gibt (treffer, gesamtanzahl) zurück, Snippets nur für die angeforderte Seite.
+    """
+    limit = limit or SEARCH_PAGE_SIZE
     conn = sqlite3.connect(DB_PATH)
     conn.row_factory = sqlite3.Row
     c = conn.cursor()
 
-    safe_query = f'"{query}"'
+    cache_key = json.dumps([query, limit, offset, sort])
+    if SEARCH_CACHE_SIZE > 0:
+        try:
+            cached = _cache_get(conn, cache_key)
+            if cached is not None:
+                conn.close()
+                return cached[0], cached[1]
+        except Exception as e:
+            logger.warning(f"Such-Cache Fehler: {e}")
+
+    safe_query = '"{}"'.format(query.replace('"', '""'))
+
+    # 1. Nur IDs der aktuellen Ergebnisseite bestimmen (ohne Snippets)
+    if sort == 'relevance':
+        id_sql = """
+            SELECT rowid FROM articles
+            WHERE articles MATCH ?
+            ORDER BY rank
+            LIMIT ? OFFSET ?
+        """
+    else:
+        id_sql = """
+            SELECT p.id FROM articles
+            JOIN pages p ON p.id = articles.rowid
+            WHERE articles MATCH ?
+            ORDER BY p.date DESC, p.page
+            LIMIT ? OFFSET ?
+        """
+
+    # 2. Snippets + Metadaten aus dem Katalog nur für diese IDs
     sql = """
-        SELECT filename, date, snippet(articles, 2, '<mark>', '</mark>', '...', 20) as snippet
-        FROM articles 
-        WHERE articles MATCH ? 
-        ORDER BY date DESC
+        SELECT articles.rowid AS id, articles.filename, articles.date, articles.page,
+               snippet(articles, 3, '<mark>', '</mark>', '...', 20) as snippet,
+               f.size
+        FROM articles
+        LEFT JOIN files f ON f.filename = articles.filename
+        WHERE articles MATCH ? AND articles.rowid IN ({})
     """
 
+    results = []
+    total = 0
+    started = time.perf_counter()
     try:
-        c.execute(sql, (safe_query,))
-        results = []
-        for row in c.fetchall():
-            r = dict(row)
-            r['indexed'] = True
-
-            # Pfad und Größe
-            fpath = Path('/app/downloads') / r['filename']
-            if fpath.exists():
-                r['size_mb'] = f"{fpath.stat().st_size / (1024 * 1024):.2f}"
-            else:
-                r['size_mb'] = "0.00"
+        total = profiling.fetchall(c, "SELECT COUNT(*) FROM articles WHERE articles MATCH ?", (safe_query,))[0][0]
+
+        ids = [row[0] for row in profiling.fetchall(c, id_sql, (safe_query, limit, offset))]
 
-            # Schönes Datum
-            r['date_display'] = format_german_date(r['date'])
+        if ids:
+            rows = {row['id']: row for row in
+                    profiling.fetchall(c, sql.format(','.join('?' * len(ids))), (safe_query, *ids))}
+            for row_id in ids:
+                r = dict(rows[row_id])
+                r['indexed'] = True
+                r['size'] = r['size'] or 0
+                r['size_mb'] = f"{r['size'] / (1024 * 1024):.2f}"
 
-            results.append(r)
+                # Schönes Datum
+                r['date_display'] = format_german_date(r['date'])
+
+                results.append(r)
+        metrics.SEARCH_SECONDS.observe(time.perf_counter() - started)
     except Exception as e:
         logger.error(f"Suchfehler: {e}")
-        results = []
+        conn.close()
+        return [], 0
+
+    # Fertige Ergebnisse nie wegen des Caches verwerfen (z.B. DB gerade von einem Job gesperrt)
+    if SEARCH_CACHE_SIZE > 0:
+        try:
+            _cache_put(conn, cache_key, [results, total])
+        except sqlite3.Error as e:
+            conn.rollback()
+            logger.warning(f"Such-Cache nicht gespeichert: {e}")
 
     conn.close()
-    return results
+    return results, total
 
 
-def get_all_files(base_dir):
+def get_all_files(base_dir, week_id=None):
     """
-    Liest alle Dateien und reichert sie mit Metadaten an.
+    Liest die Ausgaben (optional nur einer Woche) aus dem Katalog.
     """
-    db_filenames = set()
-    try:
+    with profiling.phase('catalog'):
         conn = sqlite3.connect(DB_PATH)
-        c = conn.cursor()
-        c.execute("SELECT filename FROM articles")
-        db_filenames = {row[0] for row in c.fetchall()}
+        conn.row_factory = sqlite3.Row
+        if week_id:
+            rows = conn.execute("SELECT * FROM files WHERE week_id = ? ORDER BY filename DESC", (week_id,)).fetchall()
+        else:
+            rows = conn.execute("SELECT * FROM files ORDER BY filename DESC").fetchall()
         conn.close()
-    except Exception:
-        pass
 
     results = []
+    for row in rows:
+        if row['week_id'] == "Unknown":
+            date_str = "Unbekannt"
+            date_display = row['filename']
+        else:
+            date_str = row['date']
+            date_display = format_german_date(date_str)
+
+        results.append({
+            'filename': row['filename'],
+            'date': date_str,
+            'date_display': date_display,  # Das schöne Datum für die Anzeige
+            'week_id': row['week_id'],
+            'snippet': '',
+            'indexed': bool(row['indexed']),
+            'size': row['size'] or 0,
+            'size_mb': f"{(row['size'] or 0) / (1024 * 1024):.2f}"
+        })
 
-    if base_dir.exists():
-        for f in base_dir.glob("*.pdf"):
-            filename = f.name
-            try:
-                date_str = filename.split('_')[0]
-                date_obj = datetime.strptime(date_str, '%Y-%m-%d')
+    return results
 
-                year, week, _ = date_obj.isocalendar()
-                week_id = f"{year}-W{week:02d}"
 
-                # Formatierung nutzen
-                date_display = format_german_date(date_str)
+def get_unlinearized_files():
+    """Dateinamen aller Ausgaben, die noch nicht linearisiert sind"""
+    conn = sqlite3.connect(DB_PATH)
+    names = [row[0] for row in conn.execute("SELECT filename FROM files WHERE linearized = 0 ORDER BY filename")]
+    conn.close()
+    return names
+
+
+def get_uncompressed_files():
+    """Dateinamen aller Ausgaben, die noch nicht durch die Komprimierung gelaufen sind"""
+    conn = sqlite3.connect(DB_PATH)
+    names = [row[0] for row in conn.execute("SELECT filename FROM files WHERE compressed = 0 ORDER BY filename")]
+    conn.close()
+    return names
 
-            except:
-                date_str = "Unbekannt"
-                date_display = filename
-                week_id = "Unknown"
 
-            is_indexed = filename in db_filenames
-            size_mb = f"{f.stat().st_size / (1024 * 1024):.2f}"
+def get_file_flags(filename):
+    """Katalog-Flags einer Ausgabe ({'compressed': 0/1, 'linearized': 0/1}), None wenn unbekannt"""
+    conn = sqlite3.connect(DB_PATH)
+    row = conn.execute("SELECT compressed, linearized FROM files WHERE filename = ?", (filename,)).fetchone()
+    conn.close()
+    return {'compressed': row[0], 'linearized': row[1]} if row else None
+
+
+def get_available_weeks():
+    """Alle Wochen mit mindestens einer Ausgabe, neueste zuerst"""
+    conn = sqlite3.connect(DB_PATH)
+    weeks = [row[0] for row in conn.execute("SELECT DISTINCT week_id FROM files ORDER BY week_id DESC")]
+    conn.close()
+    return weeks
+
+
+def get_existing_dates(min_size=10 * 1024):
+    """Alle Daten, für die bereits eine (nicht defekte) Ausgabe im Katalog liegt"""
+    conn = sqlite3.connect(DB_PATH)
+    dates = {row[0] for row in conn.execute("SELECT date FROM files WHERE size > ?", (min_size,))}
+    conn.close()
+    return dates
+
+
+def get_no_issue_dates():
+    """
+    Tage, die der Anbieter verlässlich als 'keine Ausgabe' gemeldet hat.
+    Zu früh geprüfte und abgelaufene Einträge zählen nicht, diese Tage werden erneut angefragt.
+    """
+    conn = sqlite3.connect(DB_PATH)
+    dates = {row[0] for row in conn.execute('''
+        SELECT date FROM no_issue_dates
+        WHERE julianday(checked) >= julianday(date) + ?
+          AND julianday(checked) >= julianday('now') - ?
+    ''', (NO_ISSUE_MIN_AGE_DAYS, NO_ISSUE_TTL_DAYS))}
+    conn.close()
+    return dates
+
+
+def mark_no_issue(date_str):
+    """Merkt sich, dass der Anbieter für dieses Datum keine Ausgabe hat (nur für ältere Tage)"""
+    try:
+        age = (datetime.now() - datetime.strptime(date_str, '%Y-%m-%d')).days
+    except ValueError:
+        return
+    if age < NO_ISSUE_MIN_AGE_DAYS:
+        logger.info(f"{date_str} ist noch zu neu, wird nicht als 'keine Ausgabe' gemerkt.")
+        return
+    try:
+        conn = sqlite3.connect(DB_PATH)
+        conn.execute("INSERT OR REPLACE INTO no_issue_dates (date) VALUES (?)", (date_str,))
+        conn.commit()
+        conn.close()
+    except Exception as e:
+        logger.error(f"Konnte {date_str} nicht als 'keine Ausgabe' speichern: {e}")
 
-            results.append({
-                'filename': filename,
-                'date': date_str,
-                'date_display': date_display,  # Das schöne Datum für die Anzeige
-                'week_id': week_id,
-                'snippet': '',
-                'indexed': is_indexed,
-                'size_mb': size_mb
-            })
 
-    return sorted(results, key=lambda x: x['filename'], reverse=True)
+def _remove_thumbnail(filename):
+    """Löscht alle Thumbnail-Varianten und Seitenbilder einer Ausgabe (inkl. altem JPG Format)"""
+    stem = Path(filename).stem
+    # Sperrdateien gleich mit (Seitenbilder hatten ihre Sperren früher unter thumbnails/.locks)
+    locks = [THUMB_DIR / '.locks' / f"{stem}.lock", *(THUMB_DIR / '.locks').glob(f"{stem}_p*.lock"),
+             *(PAGE_CACHE_DIR / '.locks').glob(f"{stem}_p*.lock")]
+    for thumb_path in [THUMB_DIR / f"{stem}.jpg", *THUMB_DIR.glob(f"{stem}_*.*"),
+                       *PAGE_CACHE_DIR.glob(f"{stem}_p*.*"), *locks]:
+        if thumb_path.exists():
+            try:
+                os.remove(thumb_path)
+            except Exception as e:
+                logger.error(f"Konnte Thumbnail nicht löschen: {e}")
 
 
 def remove_orphaned_entries(base_dir):
     conn = sqlite3.connect(DB_PATH)
     c = conn.cursor()
-    c.execute("SELECT filename FROM articles")
+    c.execute("SELECT DISTINCT filename FROM pages UNION SELECT filename FROM manifest")
     db_files = c.fetchall()
 
     deleted_count = 0
     for (filename,) in db_files:
         file_path = base_dir / filename
         if not file_path.exists():
-            c.execute("DELETE FROM articles WHERE filename = ?", (filename,))
+            c.execute("DELETE FROM pages WHERE filename = ?", (filename,))
+            c.execute("DELETE FROM manifest WHERE filename = ?", (filename,))
+            c.execute("DELETE FROM files WHERE filename = ?", (filename,))
             deleted_count += 1
             # Auch Thumbnail löschen
-            thumb_path = THUMB_DIR / f"{Path(filename).stem}.jpg"
-            if thumb_path.exists():
-                try:
-                    os.remove(thumb_path)
-                except:
-                    pass
+            _remove_thumbnail(filename)
 
     if deleted_count > 0:
+        bump_generation(conn)
         conn.commit()
     conn.close()
 
 
-def rebuild_index(base_dir):
+def process_pdf(filepath, extract=True, old_hash=None):
+    """
+    Worker-Funktion für den Prozess-Pool: Textextraktion (+ Thumbnail falls THUMBS_ON_INDEX).
+    Schreibt NICHT in die Datenbank, das macht nur der Elternprozess.
+    Ist old_hash gesetzt und der Inhalt unverändert, wird nicht neu extrahiert.
+    """
+    filename = filepath.name
+    thumb = generate_thumbnail(filepath) if THUMBS_ON_INDEX else None
+
+    st = filepath.stat()
+    result = {
+        'filename': filename,
+        'date': date_from_filename(filename),
+        'size': st.st_size,
+        'mtime': st.st_mtime,
+        'hash': None,
+        'pages': None,
+        'page_count': None,
+        'thumb': thumb,
+        'ok': not extract,
+    }
+    if not extract:
+        return result
+
+    try:
+        result['hash'] = file_hash(filepath)
+        if old_hash and result['hash'] == old_hash:
+            # Nur Zeitstempel geändert
+            result['ok'] = True
+            return result
+        with metrics.timer(metrics.INDEX_EXTRACT_SECONDS):
+            result['pages'], result['page_count'] = extract_pages(filepath)
+        result['ok'] = True
+    except Exception as e:
+        logger.error(f"Fehler beim Lesen von {filename}: {e}")
+    return result
+
+
+def _write_batch(batch):
+    """
+    Schreibt Ergebnisse von process_pdf (Index + Manifest) in einer Transaktion.
+    False bei einem Datenbankfehler (nichts geschrieben, der nächste Lauf holt es nach).
+    """
+    rows = [r for r in batch if r['ok']]
+    if not rows:
+        return True
+    conn = sqlite3.connect(DB_PATH, timeout=INDEX_WRITE_TIMEOUT)
+    try:
+        indexed = 0
+        for r in rows:
+            if r['pages'] is not None:
+                conn.execute("DELETE FROM pages WHERE filename = ?", (r['filename'],))
+                conn.executemany("INSERT INTO pages (filename, date, page, content) VALUES (?, ?, ?, ?)",
+                                 [(r['filename'], r['date'], number, text) for number, text in r['pages']])
+                indexed += 1
+            if r['hash'] is not None:
+                conn.execute("INSERT OR REPLACE INTO manifest (filename, size, mtime, hash) VALUES (?, ?, ?, ?)",
+                             (r['filename'], r['size'], r['mtime'], r['hash']))
+            else:
+                # Schon indexiert, nur Thumbnail erzeugt: Stand ohne Hash merken
+                conn.execute("INSERT OR IGNORE INTO manifest (filename, size, mtime, hash) VALUES (?, ?, ?, NULL)",
+                             (r['filename'], r['size'], r['mtime']))
+            _upsert_file(conn, r['filename'], r['size'], pages=r['page_count'], indexed=1, thumb=r['thumb'])
+        bump_generation(conn)
+        conn.commit()
+        if indexed:
+            logger.info(f"{indexed} Dateien indexiert.")
+        return True
+    except Exception as e:
+        logger.error(f"DB Fehler beim Batch-Schreiben: {e}")
+        return False
+    finally:
+        conn.close()
+
+
+def _process_all(jobs, workers):
+    """
+    jobs: Liste von (pfad, extract, old_hash).
+    Verteilt die Arbeit auf den Prozess-Pool und schreibt in Batches.
+    """
+    # Erst hier importieren: jobs importiert seinerseits indexer
+    from jobs import report_progress
+
+    batch = []
+    report_progress(0, len(jobs), force=True)
+    if workers <= 1 or len(jobs) <= 1:
+        results = (process_pdf(*job) for job in jobs)
+        for done, result in enumerate(results, start=1):
+            batch.append(result)
+            report_progress(done, item=result['filename'])
+            if len(batch) >= INDEX_BATCH_SIZE:
+                _write_batch(batch)
+                batch = []
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = pool.map(process_pdf, *zip(*jobs), chunksize=1)
+            for done, result in enumerate(results, start=1):
+                batch.append(result)
+                report_progress(done, item=result['filename'])
+                if len(batch) >= INDEX_BATCH_SIZE:
+                    _write_batch(batch)
+                    batch = []
+    _write_batch(batch)
+
+
+def rebuild_index(base_dir, workers=None):
+    """
+    Baut Index und Thumbnails für alle PDFs.
+    workers > 1: Textextraktion und Thumbnails laufen parallel in einem Prozess-Pool,
+    geschrieben wird nur hier im Elternprozess (in Batches).
+    """
     init_db()
-    # Sicherstellen, dass Thumbnails auch beim Rebuild erstellt werden
-    for pdf_file in base_dir.glob("*.pdf"):
-        index_pdf(pdf_file)
+    workers = workers or INDEX_WORKERS
+
+    conn = sqlite3.connect(DB_PATH)
+    indexed = {row[0] for row in conn.execute("SELECT filename FROM manifest")}
+    conn.close()
+
+    # Bereits indexierte Dateien nur anfassen, wenn Thumbnails beim Indexieren erzeugt werden sollen
+    pdf_files = sorted(base_dir.glob("*.pdf"))
+    jobs = [(f, f.name not in indexed, None) for f in pdf_files if THUMBS_ON_INDEX or f.name not in indexed]
+    logger.info(f"Rebuild: {len(pdf_files)} Dateien, {sum(1 for j in jobs if j[1])} neu, {workers} Worker")
+    if not jobs:
+        remove_orphaned_entries(base_dir)
+        sync_catalog(base_dir)
+        return
+
+    _process_all(jobs, workers)
     remove_orphaned_entries(base_dir)
+    sync_catalog(base_dir)
+
+
+def update_index(base_dir, workers=None):
+    """
+    Inkrementelles Reindex: Verzeichnis einmal gegen das Manifest abgleichen
+    und nur neue, geänderte oder gelöschte Dateien verarbeiten.
+    """
+    init_db()
+    workers = workers or INDEX_WORKERS
+    start = time.monotonic()
+
+    on_disk = {}
+    if base_dir.exists():
+        with os.scandir(base_dir) as it:
+            for entry in it:
+                if entry.name.endswith('.pdf') and entry.is_file():
+                    st = entry.stat()
+                    on_disk[entry.name] = (st.st_size, st.st_mtime)
+
+    sync_catalog(base_dir, on_disk)
+
+    conn = sqlite3.connect(DB_PATH)
+    manifest = {row[0]: row[1:] for row in conn.execute("SELECT filename, size, mtime, hash FROM manifest")}
+    conn.close()
+
+    jobs = []
+    for name, (size, mtime) in on_disk.items():
+        known = manifest.get(name)
+        if known is None:
+            jobs.append((base_dir / name, True, None))
+        elif known[0] != size or known[1] != mtime:
+            jobs.append((base_dir / name, True, known[2]))
+
+    removed = [name for name in manifest if name not in on_disk]
+    if removed:
+        conn = sqlite3.connect(DB_PATH)
+        for name in removed:
+            conn.execute("DELETE FROM pages WHERE filename = ?", (name,))
+            conn.execute("DELETE FROM manifest WHERE filename = ?", (name,))
+            _remove_thumbnail(name)
+        bump_generation(conn)
+        conn.commit()
+        conn.close()
+        logger.info(f"{len(removed)} gelöschte Dateien aus dem Index entfernt.")
+
+    if jobs:
+        logger.info(f"Inkrementelles Reindex: {len(jobs)} neue/geänderte Dateien, {workers} Worker")
+        _process_all(jobs, workers)
+
+    logger.info(f"Reindex fertig in {time.monotonic() - start:.2f}s "
+                f"({len(on_disk)} Dateien, {len(jobs)} verarbeitet, {len(removed)} entfernt)")
 
 
 # NEU: Gezieltes Löschen
 def delete_file_data(base_dir, filename):
     """Löscht PDF, Thumbnail und DB-Eintrag"""
     pdf_path = base_dir / filename
-    thumb_path = THUMB_DIR / f"{Path(filename).stem}.jpg"
 
     # 1. Datei löschen
     if pdf_path.exists():
@@ -231,18 +974,19 @@ def delete_file_data(base_dir, filename):
         except Exception as e:
             logger.error(f"Konnte PDF nicht löschen: {e}")
 
-    # 2. Thumbnail löschen
-    if thumb_path.exists():
-        try:
-            os.remove(thumb_path)
-        except Exception as e:
-            logger.error(f"Konnte Thumbnail nicht löschen: {e}")
+    # 2. Thumbnails und Sperrdatei löschen
+    _remove_thumbnail(filename)
+    # missing_ok: ein gleichzeitiges Löschen derselben Ausgabe kann schneller gewesen sein
+    (base_dir / '.locks' / f"{Path(filename).stem}.lock").unlink(missing_ok=True)
 
     # 3. DB Eintrag löschen
     try:
         conn = sqlite3.connect(DB_PATH)
         c = conn.cursor()
-        c.execute("DELETE FROM articles WHERE filename = ?", (filename,))
+        c.execute("DELETE FROM pages WHERE filename = ?", (filename,))
+        c.execute("DELETE FROM manifest WHERE filename = ?", (filename,))
+        c.execute("DELETE FROM files WHERE filename = ?", (filename,))
+        bump_generation(conn)
         conn.commit()
         conn.close()
         logger.info(f"Alles gelöscht für: {filename}")
@@ -0,0 +1,311 @@
+import sqlite3
+import os
+import json
+import time
+import threading
+import logging
+
+import indexer
+
+# Job-Typ -> Gruppe. Pro Gruppe läuft nur eine begrenzte Anzahl Jobs gleichzeitig,
+# Jobs verschiedener Gruppen (z.B. Indexieren und Komprimieren) laufen parallel.
+# Linearisierung und Massen-Komprimierung gehen beide das ganze Archiv in derselben
+# Reihenfolge durch und laufen deshalb nacheinander. Einzelne Dateien (manuelle
+# Komprimierung, Pipeline) schützt zusätzlich die Sperre pro Ausgabe (indexer.archive_lock).
+JOB_GROUPS = {
+    'scrape': 'epaper',
+    'archive': 'epaper',
+    'fill_gaps': 'epaper',
+    'reindex': 'index',
+    'compress': 'compress',
+    'linearize': 'bulk',
+    'bulk_compress': 'bulk',
+}
+GROUP_LIMITS = {
+    'epaper': 1,  # nur eine Browser-Session beim Anbieter
+    'index': 1,
+    'compress': 1,
+    'bulk': 1,
+}
+
+# Sekunden zwischen zwei Blicken in die Warteschlange
+POLL_INTERVAL = 2
+# Laufende Jobs ohne Lebenszeichen seit so vielen Sekunden gelten als abgebrochen (z.B. Container-Neustart)
+STALE_AFTER = 60
+# Wie oft ein abgebrochener Job neu gestartet wird
+MAX_ATTEMPTS = 3
+# Fortschritt höchstens so oft (Sekunden) in die DB schreiben
+PROGRESS_INTERVAL = 1.0
+
+logger = logging.getLogger(__name__)
+
+_handlers = {}
+_running = {}  # job_id -> thread (nur in diesem Prozess)
+_local = threading.local()
+_dispatcher_started = False
+
+
+def _connect():
+    conn = sqlite3.connect(indexer.DB_PATH, timeout=30)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+def init_db():
+    conn = _connect()
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS jobs (
+            id INTEGER PRIMARY KEY,
+            type TEXT,
+            args TEXT,
+            priority INTEGER DEFAULT 0,
+            status TEXT DEFAULT 'pending',
+            attempts INTEGER DEFAULT 0,
+            created REAL,
+            started REAL,
+            finished REAL,
+            heartbeat REAL,
+            pid INTEGER,
+            error TEXT,
+            progress_done INTEGER DEFAULT 0,
+            progress_total INTEGER,
+            progress_item TEXT,
+            progress_updated REAL
+        )
+    ''')
+    # Fortschritts-Spalten für Datenbanken aus älteren Versionen nachrüsten
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(jobs)")}
+    for column, definition in [('progress_done', 'INTEGER DEFAULT 0'), ('progress_total', 'INTEGER'),
+                               ('progress_item', 'TEXT'), ('progress_updated', 'REAL')]:
+        if column not in columns:
+            conn.execute(f"ALTER TABLE jobs ADD COLUMN {column} {definition}")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(status, priority, id)")
+    conn.commit()
+    conn.close()
+
+
+def register(job_type, func):
+    """Verknüpft einen Job-Typ mit der Funktion, die ihn ausführt"""
+    _handlers[job_type] = func
+
+
+def enqueue(job_type, *args, priority=0):
+    """
+    Stellt einen Job in die Warteschlange.
+    Gibt (job_id, neu) zurück - neu ist False, wenn ein identischer Job schon wartet.
+    """
+    args_json = json.dumps(args)
+    conn = _connect()
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        row = conn.execute("SELECT id FROM jobs WHERE status = 'pending' AND type = ? AND args = ?",
+                           (job_type, args_json)).fetchone()
+        if row:
+            conn.commit()
+            return row['id'], False
+        cur = conn.execute("INSERT INTO jobs (type, args, priority, created) VALUES (?, ?, ?, ?)",
+                           (job_type, args_json, priority, time.time()))
+        conn.commit()
+        logger.info(f"Job eingeplant: {job_type} {args_json} (#{cur.lastrowid})")
+        return cur.lastrowid, True
+    finally:
+        conn.close()
+
+
+def current_job_id():
+    """ID des Jobs, der im aktuellen Thread läuft (None außerhalb der Warteschlange)"""
+    return getattr(_local, 'job_id', None)
+
+
+def report_progress(done, total=None, item=None, force=False):
+    """
+    Fortschritt des laufenden Jobs melden (erledigt / gesamt, aktuelle Datei).
+    Außerhalb eines Jobs (z.B. im Prozess-Pool oder CLI) passiert nichts.
+    """
+    job_id = current_job_id()
+    if job_id is None:
+        return
+    now = time.time()
+    if not force and done != total and now - getattr(_local, 'progress_written', 0) < PROGRESS_INTERVAL:
+        return
+    _local.progress_written = now
+    try:
+        conn = _connect()
+        conn.execute('''
+            UPDATE jobs SET progress_done = ?, progress_total = COALESCE(?, progress_total),
+                            progress_item = COALESCE(?, progress_item), progress_updated = ?
+            WHERE id = ?
+        ''', (done, total, item, now, job_id))
+        conn.commit()
+        conn.close()
+    except Exception as e:
+        logger.warning(f"Fortschritt konnte nicht gespeichert werden: {e}")
+
+
+def get_progress():
+    """Laufende und wartende Jobs inkl. Durchsatz (Einheiten/Minute) und Restzeit (Sekunden)"""
+    conn = _connect()
+    rows = [dict(row) for row in conn.execute(
+        "SELECT * FROM jobs WHERE status IN ('running', 'pending') ORDER BY status DESC, priority DESC, id")]
+    conn.close()
+
+    now = time.time()
+    result = []
+    for row in rows:
+        done = row['progress_done'] or 0
+        total = row['progress_total']
+        elapsed = now - row['started'] if row['started'] else 0
+        rate = done / elapsed if elapsed > 0 and done else 0
+        result.append({
+            'id': row['id'],
+            'type': row['type'],
+            'status': row['status'],
+            'done': done,
+            'total': total,
+            'item': row['progress_item'],
+            'elapsed': round(elapsed),
+            'per_minute': round(rate * 60, 1),
+            'eta': round((total - done) / rate) if rate and total else None,
+        })
+    return result
+
+
+def is_busy():
+    """Läuft gerade irgendein Job (in irgendeinem Worker)?"""
+    conn = _connect()
+    row = conn.execute("SELECT COUNT(*) FROM jobs WHERE status = 'running'").fetchone()
+    conn.close()
+    return row[0] > 0
+
+
+def queue_depth():
+    """Anzahl wartender Jobs"""
+    conn = _connect()
+    row = conn.execute("SELECT COUNT(*) FROM jobs WHERE status = 'pending'").fetchone()
+    conn.close()
+    return row[0]
+
+
+def recent_jobs(limit=20):
+    conn = _connect()
+    rows = [dict(row) for row in conn.execute("SELECT * FROM jobs ORDER BY id DESC LIMIT ?", (limit,))]
+    conn.close()
+    return rows
+
+
+def _recover_stale(conn):
+    """Jobs, deren Worker nicht mehr lebt (Neustart/Absturz), wieder einplanen"""
+    limit = time.time() - STALE_AFTER
+    stale = conn.execute("SELECT id, type, attempts FROM jobs WHERE status = 'running' AND heartbeat < ?",
+                         (limit,)).fetchall()
+    for row in stale:
+        if row['attempts'] >= MAX_ATTEMPTS:
+            conn.execute("UPDATE jobs SET status = 'failed', finished = ?, error = 'abgebrochen' WHERE id = ?",
+                         (time.time(), row['id']))
+            logger.error(f"Job #{row['id']} ({row['type']}) endgültig abgebrochen.")
+        else:
+            conn.execute("UPDATE jobs SET status = 'pending', pid = NULL WHERE id = ?", (row['id'],))
+            logger.warning(f"Job #{row['id']} ({row['type']}) war unterbrochen, wird neu gestartet.")
+
+
+def _claim():
+    """Holt den nächsten ausführbaren Job (atomar über alle Worker hinweg)"""
+    conn = _connect()
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        _recover_stale(conn)
+
+        running = {}
+        for row in conn.execute("SELECT type FROM jobs WHERE status = 'running'"):
+            group = JOB_GROUPS.get(row['type'], row['type'])
+            running[group] = running.get(group, 0) + 1
+
+        pending = conn.execute("SELECT * FROM jobs WHERE status = 'pending' ORDER BY priority DESC, id").fetchall()
+        for job in pending:
+            if job['type'] not in _handlers:
+                continue
+            group = JOB_GROUPS.get(job['type'], job['type'])
+            if running.get(group, 0) >= GROUP_LIMITS.get(group, 1):
+                continue
+            now = time.time()
+            conn.execute('''
+                UPDATE jobs SET status = 'running', started = ?, heartbeat = ?, pid = ?, attempts = attempts + 1,
+                                progress_done = 0, progress_total = NULL, progress_item = NULL
+                WHERE id = ?
+            ''', (now, now, os.getpid(), job['id']))
+            conn.commit()
+            return dict(job)
+        conn.commit()
+        return None
+    finally:
+        conn.close()
+
+
+def _finish(job_id, error=None):
+    conn = _connect()
+    conn.execute("UPDATE jobs SET status = ?, finished = ?, error = ? WHERE id = ?",
+                 ('failed' if error else 'done', time.time(), error, job_id))
+    conn.commit()
+    conn.close()
+
+
+def _run(job):
+    _local.job_id = job['id']
+    _local.progress_written = 0
+    try:
+        logger.info(f"Starte Job #{job['id']}: {job['type']}")
+        _handlers[job['type']](*json.loads(job['args']))
+        _finish(job['id'])
+    except Exception as e:
+        logger.error(f"Job #{job['id']} ({job['type']}) fehlgeschlagen: {e}")
+        _finish(job['id'], str(e))
+    finally:
+        _local.job_id = None
+        _running.pop(job['id'], None)
+
+
+def _heartbeat():
+    """Lebenszeichen für alle Jobs, die in diesem Prozess laufen"""
+    if not _running:
+        return
+    conn = _connect()
+    conn.executemany("UPDATE jobs SET heartbeat = ? WHERE id = ?", [(time.time(), job_id) for job_id in _running])
+    conn.commit()
+    conn.close()
+
+
+def _cleanup(days=7):
+    conn = _connect()
+    conn.execute("DELETE FROM jobs WHERE status IN ('done', 'failed') AND finished < ?",
+                 (time.time() - days * 86400,))
+    conn.commit()
+    conn.close()
+
+
+def _dispatch_loop():
+    last_cleanup = 0
+    while True:
+        try:
+            _heartbeat()
+            job = _claim()
+            while job:
+                thread = threading.Thread(target=_run, args=(job,), daemon=True)
+                _running[job['id']] = thread
+                thread.start()
+                job = _claim()
+            if time.time() - last_cleanup > 3600:
+                _cleanup()
+                last_cleanup = time.time()
+        except Exception as e:
+            logger.error(f"Job-Warteschlange Fehler: {e}")
+        time.sleep(POLL_INTERVAL)
+
+
+def start_dispatcher():
+    """Startet den Dispatcher-Thread (einmal pro Prozess)"""
+    global _dispatcher_started
+    if _dispatcher_started:
+        return
+    _dispatcher_started = True
+    init_db()
+    threading.Thread(target=_dispatch_loop, daemon=True, name='job-dispatcher').start()
@@ -0,0 +1,161 @@
+import os
+import json
+import time
+import logging
+from datetime import datetime
+
+# Job-ID des laufenden Jobs in jeden Log-Eintrag schreiben
+from jobs import current_job_id
+
+LEVELS = {'DEBUG': 10, 'INFO': 20, 'WARNING': 30, 'ERROR': 40, 'CRITICAL': 50}
+# Blockgröße beim Rückwärtslesen
+TAIL_BLOCK_SIZE = 64 * 1024
+
+
+class JsonFormatter(logging.Formatter):
+    """Ein JSON-Objekt pro Zeile: Zeit, Level, Komponente (Logger), Job-ID, Nachricht"""
+
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created).strftime('%Y-%m-%d %H:%M:%S'),
+            'level': record.levelname,
+            'component': record.name,
+            'job': current_job_id(),
+            'message': record.getMessage(),
+        }
+        if record.exc_info:
+            entry['message'] += '\n' + self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+
+def parse_line(line):
+    """Log-Zeile in ein Dict umwandeln (alte Textzeilen werden als Nachricht übernommen)"""
+    line = line.rstrip('\n')
+    try:
+        entry = json.loads(line)
+        if isinstance(entry, dict):
+            return entry
+    except ValueError:
+        pass
+    # Altes Format: '2026-01-30 06:00:01,123 - INFO - Nachricht'
+    parts = line.split(' - ', 2)
+    if len(parts) == 3 and parts[1] in LEVELS:
+        return {'time': parts[0].split(',')[0], 'level': parts[1], 'component': None, 'job': None,
+                'message': parts[2]}
+    return {'time': None, 'level': None, 'component': None, 'job': None, 'message': line}
+
+
+def format_entry(entry):
+    """Lesbare Textzeile für die Konsole"""
+    parts = [entry.get('time') or '', entry.get('level') or '']
+    if entry.get('component'):
+        parts.append(f"[{entry['component']}]")
+    if entry.get('job'):
+        parts.append(f"#{entry['job']}")
+    return ' '.join(p for p in parts if p) + ' - ' + entry.get('message', '')
+
+
+def make_filter(level=None, component=None, job=None, query=None):
+    """Filterfunktion für Log-Einträge (alle Bedingungen müssen passen)"""
+    min_level = LEVELS.get((level or '').upper(), 0)
+    query = (query or '').lower()
+
+    def matches(entry):
+        if min_level and LEVELS.get(entry.get('level'), 0) < min_level:
+            return False
+        if component and entry.get('component') != component:
+            return False
+        if job and str(entry.get('job')) != str(job):
+            return False
+        if query and query not in entry.get('message', '').lower():
+            return False
+        return True
+
+    return matches
+
+
+def _reverse_lines(path):
+    """Liefert die Zeilen einer Datei von hinten nach vorne, liest dabei nur Blöcke vom Dateiende"""
+    with open(path, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        position = f.tell()
+        rest = b''
+        while position > 0:
+            read_size = min(TAIL_BLOCK_SIZE, position)
+            position -= read_size
+            f.seek(position)
+            block = f.read(read_size) + rest
+            lines = block.split(b'\n')
+            # Erste Zeile ist evtl. unvollständig, sie wird mit dem nächsten Block zusammengesetzt
+            rest = lines.pop(0)
+            for line in reversed(lines):
+                if line:
+                    yield line.decode('utf-8', 'replace')
+        if rest:
+            yield rest.decode('utf-8', 'replace')
+
+
+def tail(log_path, lines=100, matches=None):
+    """
+    Die letzten passenden Einträge (älteste zuerst), inklusive der rotierten Datei (.1).
+    Es wird nur so weit von hinten gelesen, bis genug Einträge gefunden sind.
+    """
+    result = []
+    for path in (log_path, log_path.with_name(log_path.name + '.1')):
+        if not path.exists():
+            continue
+        for line in _reverse_lines(path):
+            entry = parse_line(line)
+            if matches is None or matches(entry):
+                result.append(entry)
+                if len(result) >= lines:
+                    return result[::-1]
+    return result[::-1]
+
+
+def follow(log_path, matches=None, timeout=300, poll_interval=0.5, keepalive=15):
+    """
+    Generator für neue Einträge ab jetzt (wie 'tail -f'), erkennt die Rotation der Datei.
+    Liefert None als Lebenszeichen, wenn keepalive Sekunden lang nichts passiert ist.
+    """
+    end_time = time.time() + timeout
+    f = None
+    inode = None
+    first_open = True
+    last_sent = time.time()
+    try:
+        while time.time() < end_time:
+            if f is None and log_path.exists():
+                f = open(log_path, 'rb')
+                inode = os.fstat(f.fileno()).st_ino
+                # Beim ersten Öffnen nur Neues, nach einer Rotation die neue Datei von vorne
+                if first_open:
+                    f.seek(0, os.SEEK_END)
+                    first_open = False
+            if f is not None:
+                position = f.tell()
+                line = f.readline()
+                while line.endswith(b'\n'):
+                    entry = parse_line(line.decode('utf-8', 'replace'))
+                    if matches is None or matches(entry):
+                        last_sent = time.time()
+                        yield entry
+                    position = f.tell()
+                    line = f.readline()
+                # Unvollständige Zeile beim nächsten Durchlauf erneut lesen
+                f.seek(position)
+                try:
+                    rotated = os.stat(log_path).st_ino != inode
+                except FileNotFoundError:
+                    rotated = True
+                if rotated:
+                    f.close()
+                    f = None
+                    continue
+            if time.time() - last_sent >= keepalive:
+                last_sent = time.time()
+                yield None
+            time.sleep(poll_interval)
+    finally:
+        if f is not None:
+            f.close()
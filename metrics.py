@@ -0,0 +1,129 @@
+import os
+import time
+import sqlite3
+import logging
+from contextlib import contextmanager
+
+import indexer
+
+# prometheus_client ist optional: ohne das Paket laufen alle Messpunkte ins Leere
+try:
+    from prometheus_client import Histogram, CollectorRegistry, REGISTRY, generate_latest, CONTENT_TYPE_LATEST
+    from prometheus_client import multiprocess
+    from prometheus_client.core import GaugeMetricFamily
+    PROMETHEUS = True
+except ImportError:
+    PROMETHEUS = False
+    CONTENT_TYPE_LATEST = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Mit gesetztem PROMETHEUS_MULTIPROC_DIR (siehe Dockerfile) werden die Werte aller
+# Gunicorn Worker, des Schedulers und der Prozess-Pools zusammengefasst
+MULTIPROCESS = bool(os.getenv('PROMETHEUS_MULTIPROC_DIR'))
+
+logger = logging.getLogger(__name__)
+
+
+class _NoopMetric:
+    def labels(self, *args, **kwargs):
+        return self
+
+    def observe(self, value):
+        pass
+
+
+def _histogram(name, documentation, labelnames=(), buckets=None):
+    if not PROMETHEUS:
+        return _NoopMetric()
+    kwargs = {'buckets': buckets} if buckets else {}
+    return Histogram(name, documentation, labelnames, **kwargs)
+
+
+REQUEST_SECONDS = _histogram('zeitung_request_seconds', 'Antwortzeit pro Route', ('route', 'method'))
+SEARCH_SECONDS = _histogram('zeitung_search_seconds', 'Dauer von search_articles (ohne Cache-Treffer)',
+                            buckets=(.001, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5))
+INDEX_EXTRACT_SECONDS = _histogram('zeitung_index_extract_seconds', 'Textextraktion pro Ausgabe',
+                                   buckets=(.1, .25, .5, 1, 2.5, 5, 10, 30, 60))
+COMPRESS_SECONDS = _histogram('zeitung_compress_seconds', 'Dauer von compress_pdf', ('mode',),
+                              buckets=(1, 5, 10, 30, 60, 120, 300, 600))
+COMPRESS_SAVINGS = _histogram('zeitung_compress_savings_ratio', 'Ersparnis der Komprimierung (0-1)', ('mode',),
+                              buckets=(0, .1, .2, .3, .4, .5, .6, .7, .8, .9))
+SCRAPE_DAY_SECONDS = _histogram('zeitung_scrape_day_seconds', 'Download-Dauer pro Ausgabe und Versuch',
+                                ('method', 'attempt', 'result'),
+                                buckets=(1, 2.5, 5, 10, 20, 30, 60, 120, 180, 300))
+
+
+@contextmanager
+def timer(metric, **labels):
+    """Misst die Dauer des Blocks in der angegebenen Histogram-Metrik"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        (metric.labels(**labels) if labels else metric).observe(time.perf_counter() - start)
+
+
+def _dir_size(directory):
+    total = count = 0
+    try:
+        with os.scandir(directory) as it:
+            for entry in it:
+                if entry.is_file():
+                    total += entry.stat().st_size
+                    count += 1
+    except OSError:
+        pass
+    return total, count
+
+
+class _StateCollector:
+    """Aktuelle Zustandswerte, werden bei jedem Abruf frisch gelesen (gleich in allen Workern)"""
+
+    def collect(self):
+        files = GaugeMetricFamily('zeitung_archive_files', 'Ausgaben im Katalog')
+        archive_bytes = GaugeMetricFamily('zeitung_archive_bytes', 'Größe aller Ausgaben')
+        queue = GaugeMetricFamily('zeitung_job_queue_depth', 'Jobs in der Warteschlange', labels=['status'])
+        try:
+            conn = sqlite3.connect(indexer.DB_PATH, timeout=5)
+            count, size = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM files").fetchone()
+            files.add_metric([], count)
+            archive_bytes.add_metric([], size)
+            depth = {'pending': 0, 'running': 0}
+            depth.update(conn.execute(
+                "SELECT status, COUNT(*) FROM jobs WHERE status IN ('pending', 'running') GROUP BY status"))
+            for status, count in depth.items():
+                queue.add_metric([status], count)
+            conn.close()
+        except sqlite3.Error as e:
+            logger.warning(f"Metriken: Datenbank nicht lesbar: {e}")
+        yield files
+        yield archive_bytes
+        yield queue
+
+        db_size = GaugeMetricFamily('zeitung_db_bytes', 'Größe der SQLite Datenbank (inkl. WAL)')
+        db_size.add_metric([], sum(p.stat().st_size for p in indexer.DB_PATH.parent.glob(indexer.DB_PATH.name + '*')
+                                   if p.is_file()))
+        yield db_size
+
+        cache = GaugeMetricFamily('zeitung_cache_bytes', 'Größe der Bild-Caches', labels=['cache'])
+        cache_files = GaugeMetricFamily('zeitung_cache_files', 'Dateien in den Bild-Caches', labels=['cache'])
+        for name, directory in (('thumbnails', indexer.THUMB_DIR), ('pages', indexer.PAGE_CACHE_DIR)):
+            size, count = _dir_size(directory)
+            cache.add_metric([name], size)
+            cache_files.add_metric([name], count)
+        yield cache
+        yield cache_files
+
+
+def render():
+    """Text im Prometheus-Format, gibt (inhalt, content type) zurück"""
+    if not PROMETHEUS:
+        return "# prometheus_client ist nicht installiert\n", CONTENT_TYPE_LATEST
+    if MULTIPROCESS:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    # Zustandswerte in einer eigenen Registry, damit sie nicht pro Worker mehrfach gezählt werden
+    state_registry = CollectorRegistry()
+    state_registry.register(_StateCollector())
+    return generate_latest(registry) + generate_latest(state_registry), CONTENT_TYPE_LATEST
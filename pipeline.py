@@ -0,0 +1,141 @@
+import os
+import sqlite3
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from pathlib import Path
+
+import indexer
+
+# Kompressor Import
+try:
+    from compressor import compress_pdf
+except ImportError:
+    def compress_pdf(path, linearize=None, parallel=None):
+        return False
+
+# Neue Downloads während des Archiv-Downloads gleich komprimieren
+PIPELINE_COMPRESS = os.getenv("PIPELINE_COMPRESS", "True").lower() == "true"
+# Gleichzeitige Ghostscript-Läufe (Threads, die Arbeit passiert im Ghostscript-Prozess)
+PIPELINE_COMPRESS_WORKERS = max(1, int(os.getenv("PIPELINE_COMPRESS_WORKERS", "1")))
+# Prozesse für Textextraktion und Thumbnails
+PIPELINE_INDEX_WORKERS = max(1, int(os.getenv("PIPELINE_INDEX_WORKERS", "2")))
+
+logger = logging.getLogger(__name__)
+
+
+def init_db():
+    conn = sqlite3.connect(indexer.DB_PATH, timeout=30)
+    # Eine Zeile pro Datei, die noch nicht alle Stufen durchlaufen hat (fertige werden gelöscht)
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS pipeline_items (
+            filename TEXT PRIMARY KEY,
+            stage TEXT,
+            error TEXT,
+            updated REAL
+        )
+    ''')
+    conn.commit()
+    conn.close()
+
+
+def _set_stage(filename, stage, error=None):
+    conn = sqlite3.connect(indexer.DB_PATH, timeout=30)
+    if stage == 'done':
+        conn.execute("DELETE FROM pipeline_items WHERE filename = ?", (filename,))
+    else:
+        conn.execute("INSERT OR REPLACE INTO pipeline_items (filename, stage, error, updated) VALUES (?, ?, ?, ?)",
+                     (filename, stage, error, time.time()))
+    conn.commit()
+    conn.close()
+
+
+def _index_item(path):
+    """Pool-Worker: Text extrahieren und Thumbnails erzeugen"""
+    # Fehler nicht verschlucken, sonst gilt die Datei als fertig und fehlt im Suchindex
+    if not indexer.index_pdf(path):
+        raise RuntimeError("Index nicht geschrieben")
+    indexer.ensure_thumbnail(path)
+    return path.name
+
+
+class ArchivePipeline:
+    """
+    Verarbeitet fertige Downloads, während der Browser schon die nächsten Tage lädt:
+    download -> komprimieren (Threads) -> indexieren + Thumbnails (Prozesse).
+    Der Stand jeder Datei steht in der Datenbank, nach einem Absturz wird beim
+    nächsten Lauf an der richtigen Stufe weitergemacht.
+    """
+
+    def __init__(self, base_dir, compress=None, compress_workers=None, index_workers=None):
+        self.base_dir = Path(base_dir)
+        self.compress = PIPELINE_COMPRESS if compress is None else compress
+        self.compress_pool = ThreadPoolExecutor(max_workers=compress_workers or PIPELINE_COMPRESS_WORKERS)
+        self.index_pool = ProcessPoolExecutor(max_workers=index_workers or PIPELINE_INDEX_WORKERS)
+        self.lock = threading.Lock()
+        self.processed = 0
+        init_db()
+
+    def __enter__(self):
+        self.resume()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+    def resume(self):
+        """Dateien eines abgebrochenen Laufs wieder einreihen"""
+        conn = sqlite3.connect(indexer.DB_PATH, timeout=30)
+        rows = conn.execute("SELECT filename, stage FROM pipeline_items ORDER BY filename").fetchall()
+        conn.close()
+        if rows:
+            logger.info(f"Pipeline: setze {len(rows)} unvollständige Dateien fort.")
+        for filename, stage in rows:
+            path = self.base_dir / filename
+            if not path.exists():
+                _set_stage(filename, 'done')
+            elif stage == 'downloaded':
+                self.submit(path)
+            else:
+                self._submit_index(path)
+
+    def submit(self, path):
+        """Fertigen Download einreihen (wird vom Scraper pro Datei aufgerufen)"""
+        path = Path(path)
+        _set_stage(path.name, 'downloaded')
+        if self.compress:
+            self.compress_pool.submit(self._compress, path)
+        else:
+            self._submit_index(path)
+
+    def _compress(self, path):
+        try:
+            compress_pdf(path)
+        except Exception as e:
+            # Unkomprimiert weiterverarbeiten, die Massen-Komprimierung holt es später nach
+            logger.error(f"Pipeline: Komprimierung von {path.name} fehlgeschlagen: {e}")
+        _set_stage(path.name, 'compressed')
+        self._submit_index(path)
+
+    def _submit_index(self, path):
+        future = self.index_pool.submit(_index_item, path)
+        future.add_done_callback(lambda f: self._indexed(path, f))
+
+    def _indexed(self, path, future):
+        try:
+            future.result()
+            _set_stage(path.name, 'done')
+            with self.lock:
+                self.processed += 1
+        except Exception as e:
+            logger.error(f"Pipeline: Indexierung von {path.name} fehlgeschlagen: {e}")
+            _set_stage(path.name, 'compressed', str(e))
+
+    def close(self):
+        """Wartet, bis alle eingereihten Dateien alle Stufen durchlaufen haben"""
+        # Reihenfolge wichtig: die Komprimierung reiht noch in den Index-Pool ein
+        self.compress_pool.shutdown(wait=True)
+        self.index_pool.shutdown(wait=True)
+        logger.info(f"Pipeline: {self.processed} Dateien fertig verarbeitet.")
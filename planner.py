@@ -0,0 +1,87 @@
+import os
+import logging
+from datetime import date, datetime, timedelta
+
+# Katalog Import (vorhandene Ausgaben und bekannte Tage ohne Ausgabe)
+from indexer import get_existing_dates, get_no_issue_dates
+
+logger = logging.getLogger(__name__)
+
+# Sonntage und Feiertage gar nicht erst beim Anbieter anfragen
+SKIP_SUNDAYS = os.getenv("SKIP_SUNDAYS", "True").lower() == "true"
+SKIP_HOLIDAYS = os.getenv("SKIP_HOLIDAYS", "True").lower() == "true"
+
+
+def easter_sunday(year):
+    """Ostersonntag nach der Gaußschen Osterformel (Anonymer Gregorianischer Algorithmus)"""
+    a = year % 19
+    b, c = divmod(year, 100)
+    d, e = divmod(b, 4)
+    f = (b + 8) // 25
+    g = (b - f + 1) // 3
+    h = (19 * a + b - d - g + 15) % 30
+    i, k = divmod(c, 4)
+    l = (32 + 2 * e + 2 * i - h - k) % 7
+    m = (a + 11 * h + 22 * l) // 451
+    month, day = divmod(h + l - 7 * m + 114, 31)
+    return date(year, month, day + 1)
+
+
+def holidays(year):
+    """Gesetzliche Feiertage in Rheinland-Pfalz (an diesen Tagen erscheint keine Zeitung)"""
+    easter = easter_sunday(year)
+    return {
+        date(year, 1, 1),  # Neujahr
+        easter - timedelta(days=2),  # Karfreitag
+        easter + timedelta(days=1),  # Ostermontag
+        date(year, 5, 1),  # Tag der Arbeit
+        easter + timedelta(days=39),  # Christi Himmelfahrt
+        easter + timedelta(days=50),  # Pfingstmontag
+        easter + timedelta(days=60),  # Fronleichnam
+        date(year, 10, 3),  # Tag der Deutschen Einheit
+        date(year, 11, 1),  # Allerheiligen
+        date(year, 12, 25),  # 1. Weihnachtstag
+        date(year, 12, 26),  # 2. Weihnachtstag
+    }
+
+
+def is_publication_day(day):
+    if SKIP_SUNDAYS and day.weekday() == 6:
+        return False
+    if SKIP_HOLIDAYS and day in holidays(day.year):
+        return False
+    return True
+
+
+def plan_missing_dates(start, end=None):
+    """
+    Berechnet in einem Durchgang alle fehlenden Ausgaben zwischen start und end (inklusive).
+    Übersprungen werden vorhandene Ausgaben, Sonn- und Feiertage sowie Tage,
+    für die der Anbieter schon einmal 'keine Ausgabe' gemeldet hat.
+    Rückgabe: Liste von ISO-Daten, neueste zuerst.
+    """
+    if isinstance(start, str):
+        start = datetime.strptime(start, "%Y-%m-%d").date()
+    if end is None:
+        end = date.today()
+    elif isinstance(end, str):
+        end = datetime.strptime(end, "%Y-%m-%d").date()
+    if start > end:
+        start, end = end, start
+
+    skip = get_existing_dates() | get_no_issue_dates()
+    missing = []
+    skipped_days = 0
+    day = end
+    while day >= start:
+        iso = day.isoformat()
+        if iso not in skip:
+            if is_publication_day(day):
+                missing.append(iso)
+            else:
+                skipped_days += 1
+        day -= timedelta(days=1)
+
+    logger.info(f"Planung {start} bis {end}: {len(missing)} fehlende Ausgaben "
+                f"({skipped_days} Sonn-/Feiertage übersprungen)")
+    return missing
@@ -0,0 +1,183 @@
+import os
+import re
+import sys
+import json
+import time
+import sqlite3
+import logging
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from pathlib import Path
+
+import indexer
+
+# Opt-in: Phasen-Zeiten pro Request, Log langsamer FTS-Abfragen, Sampling-Profile
+PROFILING = os.getenv('PROFILING', 'False').lower() == 'true'
+# Ab dieser Dauer (ms) wird eine FTS-Abfrage samt Query-Plan geloggt
+SLOW_QUERY_MS = float(os.getenv('SLOW_QUERY_MS', '200'))
+# Ab dieser Dauer (ms) wird ein Request in der Admin-Ansicht gelistet
+SLOW_REQUEST_MS = float(os.getenv('SLOW_REQUEST_MS', '500'))
+# Abstand zwischen zwei Stichproben des Sampling-Profilers (Sekunden)
+SAMPLE_INTERVAL = 0.005
+# So viele langsame Requests werden aufbewahrt
+SLOW_REQUESTS_KEEP = 500
+
+PROFILE_DIR = Path('/app/downloads/profiles')
+
+logger = logging.getLogger(__name__)
+
+_local = threading.local()
+
+
+def init_db():
+    conn = sqlite3.connect(indexer.DB_PATH, timeout=30)
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS slow_requests (
+            id INTEGER PRIMARY KEY,
+            created REAL,
+            method TEXT,
+            path TEXT,
+            status INTEGER,
+            duration REAL,
+            phases TEXT,
+            profile TEXT
+        )
+    ''')
+    conn.commit()
+    conn.close()
+
+
+def start_request():
+    _local.phases = {}
+    _local.started = time.perf_counter()
+
+
+def add_phase(name, seconds):
+    """Zeit zu einer Phase des laufenden Requests addieren (außerhalb eines Requests: nichts)"""
+    phases = getattr(_local, 'phases', None)
+    if phases is not None:
+        phases[name] = phases.get(name, 0.0) + seconds
+
+
+@contextmanager
+def phase(name):
+    """Misst einen Abschnitt als Phase des laufenden Requests"""
+    if not PROFILING:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        add_phase(name, time.perf_counter() - start)
+
+
+def fetchall(cursor, sql, params=()):
+    """
+    cursor.execute(...).fetchall() mit Messung: die Zeit zählt zur Phase 'fts',
+    langsame Abfragen werden mit EXPLAIN QUERY PLAN geloggt.
+    """
+    if not PROFILING:
+        return cursor.execute(sql, params).fetchall()
+    start = time.perf_counter()
+    rows = cursor.execute(sql, params).fetchall()
+    duration = time.perf_counter() - start
+    add_phase('fts', duration)
+    if duration * 1000 >= SLOW_QUERY_MS:
+        try:
+            plan = [row[-1] for row in cursor.connection.execute(f"EXPLAIN QUERY PLAN {sql}", params)]
+        except sqlite3.Error as e:
+            plan = [f"Plan nicht verfügbar: {e}"]
+        logger.warning(f"Langsame Abfrage ({duration * 1000:.0f} ms): {' '.join(sql.split())} "
+                       f"Parameter: {params!r} Plan: {' | '.join(plan)}")
+    return rows
+
+
+class SamplingProfiler:
+    """
+    Einfacher Sampling-Profiler für einen Thread: nimmt in festen Abständen den Stack auf
+    und schreibt ihn im 'collapsed stack' Format (für flamegraph.pl / speedscope).
+    """
+
+    def __init__(self, thread_id, interval=SAMPLE_INTERVAL):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.samples = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True, name='sampling-profiler')
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({Path(code.co_filename).name}:{frame.f_lineno})")
+                frame = frame.f_back
+            if stack:
+                self.samples[';'.join(reversed(stack))] += 1
+
+    def stop(self, path):
+        self._stop.set()
+        self._thread.join()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            for stack, count in self.samples.most_common():
+                f.write(f"{stack} {count}\n")
+        return path
+
+
+def start_sampling():
+    _local.profiler = SamplingProfiler(threading.get_ident()).start()
+
+
+def finish_request(method, path, status):
+    """
+    Request abschließen: gibt (dauer, phasen) zurück und speichert langsame Requests.
+    Ein laufender Sampling-Profiler wird gestoppt und in PROFILE_DIR geschrieben.
+    """
+    started = getattr(_local, 'started', None)
+    if started is None:
+        return None, {}
+    duration = time.perf_counter() - started
+    phases = _local.phases
+    _local.started = _local.phases = None
+
+    profile_name = None
+    profiler = getattr(_local, 'profiler', None)
+    if profiler:
+        _local.profiler = None
+        slug = re.sub(r'[^A-Za-z0-9_-]+', '_', path.split('?')[0].strip('/')) or 'index'
+        profile_name = f"{time.strftime('%Y%m%d-%H%M%S')}_{slug[:40]}.folded"
+        profiler.stop(PROFILE_DIR / profile_name)
+        logger.info(f"Profil gespeichert: {profile_name} ({sum(profiler.samples.values())} Stichproben)")
+
+    if duration * 1000 >= SLOW_REQUEST_MS or profile_name:
+        try:
+            conn = sqlite3.connect(indexer.DB_PATH, timeout=5)
+            conn.execute("INSERT INTO slow_requests (created, method, path, status, duration, phases, profile) "
+                         "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                         (time.time(), method, path, status, duration, json.dumps(phases), profile_name))
+            conn.execute("DELETE FROM slow_requests WHERE id <= (SELECT MAX(id) FROM slow_requests) - ?",
+                         (SLOW_REQUESTS_KEEP,))
+            conn.commit()
+            conn.close()
+        except sqlite3.Error as e:
+            logger.warning(f"Langsamer Request konnte nicht gespeichert werden: {e}")
+    return duration, phases
+
+
+def slowest_requests(limit=50):
+    conn = sqlite3.connect(indexer.DB_PATH)
+    conn.row_factory = sqlite3.Row
+    rows = [dict(row) for row in conn.execute(
+        "SELECT * FROM slow_requests ORDER BY duration DESC LIMIT ?", (limit,))]
+    conn.close()
+    for row in rows:
+        row['phases'] = json.loads(row['phases'] or '{}')
+    return rows
@@ -0,0 +1,35 @@
+import os
+import sys
+import random
+from pathlib import Path
+
+import pytest
+
+# Module liegen flach im Projektordner, Pfade wie im Container (indexer nutzt ohnehin /app/downloads)
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault('RUNNING_IN_DOCKER', 'true')
+
+import indexer
+import benchmark
+
+
+@pytest.fixture
+def archive(tmp_path, monkeypatch):
+    """Leeres Archiv mit eigener Datenbank und eigenen Caches (das echte Archiv bleibt unberührt)"""
+    monkeypatch.setattr(indexer, 'DB_PATH', tmp_path / 'zeitung.db')
+    monkeypatch.setattr(indexer, 'THUMB_DIR', tmp_path / 'thumbnails')
+    monkeypatch.setattr(indexer, 'PAGE_CACHE_DIR', tmp_path / 'pages')
+    indexer.THUMB_DIR.mkdir()
+    indexer.PAGE_CACHE_DIR.mkdir()
+    indexer.init_db()
+    return tmp_path
+
+
+@pytest.fixture
+def make_issue():
+    """Schreibt eine synthetische Ausgabe (Text + Fotos) wie im Benchmark"""
+    def make(path, pages=4, issue_no=1):
+        photos = benchmark._make_photos(random.Random(benchmark.SEED), count=2)
+        benchmark.write_issue(path, issue_no, pages, random.Random(benchmark.SEED + issue_no), photos)
+        return path
+    return make
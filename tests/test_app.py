@@ -0,0 +1,74 @@
+import pytest
+
+import indexer
+
+import app as app_module
+
+
+@pytest.fixture
+def client(archive, monkeypatch):
+    monkeypatch.setattr(app_module, 'base_dir', archive)
+    app_module.app.config['TESTING'] = True
+    client = app_module.app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = 'guest'
+        session['_fresh'] = True
+    return client
+
+
+@pytest.fixture
+def pdf(archive, make_issue):
+    return make_issue(archive / '2024-01-02_Wormser_Zeitung.pdf', pages=2)
+
+
+def test_download_etag_revalidation(client, pdf):
+    first = client.get(f'/download/{pdf.name}')
+    assert first.status_code == 200
+    assert first.data == pdf.read_bytes()
+    etag = first.headers['ETag']
+    assert etag and not etag.startswith('W/')
+
+    again = client.get(f'/download/{pdf.name}', headers={'If-None-Match': etag})
+    assert again.status_code == 304
+    assert again.data == b''
+
+    # Datei wurde z.B. komprimiert: neuer ETag, volle Antwort
+    pdf.write_bytes(pdf.read_bytes() + b'\n')
+    changed = client.get(f'/download/{pdf.name}', headers={'If-None-Match': etag})
+    assert changed.status_code == 200
+    assert changed.headers['ETag'] != etag
+
+
+def test_download_range(client, pdf):
+    response = client.get(f'/download/{pdf.name}', headers={'Range': 'bytes=0-99'})
+    assert response.status_code == 206
+    assert response.data == pdf.read_bytes()[:100]
+    assert response.headers['Content-Range'] == f"bytes 0-99/{pdf.stat().st_size}"
+    assert response.headers['Accept-Ranges'] == 'bytes'
+
+
+def test_download_content_disposition(client, pdf):
+    inline = client.get(f'/download/{pdf.name}')
+    assert inline.headers['Content-Disposition'].startswith('inline')
+    assert pdf.name in inline.headers['Content-Disposition']
+
+    attachment = client.get(f'/download/{pdf.name}?dl=1')
+    assert attachment.headers['Content-Disposition'].startswith('attachment')
+    assert pdf.name in attachment.headers['Content-Disposition']
+
+
+def test_download_missing_file(client):
+    assert client.get('/download/2024-01-03_Wormser_Zeitung.pdf').status_code == 404
+
+
+def test_thumbnail_etag_and_cache_headers(client, pdf):
+    thumb = indexer.thumbnail_path(pdf.name, 'small')
+    thumb.write_bytes(b'RIFF0000WEBPVP8 ')
+
+    first = client.get(f'/thumbnail/{pdf.name}?size=small')
+    assert first.status_code == 200
+    assert first.headers['Cache-Control'] == 'private, max-age=86400'
+
+    again = client.get(f'/thumbnail/{pdf.name}?size=small&v=1', headers={'If-None-Match': first.headers['ETag']})
+    assert again.status_code == 304
+    assert 'immutable' in again.headers['Cache-Control']
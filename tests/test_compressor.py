@@ -0,0 +1,137 @@
+import io
+import shutil
+import sqlite3
+
+import pytest
+from PIL import Image
+from pypdf import PdfReader, PdfWriter
+
+import compressor
+import indexer
+
+
+def copy_ghostscript(input_path, output_path, quality_mode='balanced'):
+    """Ersatz ohne Ghostscript: schreibt den Seitenblock unverändert neu"""
+    PdfWriter(clone_from=str(input_path)).write(str(output_path))
+
+
+@pytest.fixture(params=['stub', 'ghostscript'])
+def ghostscript(request, monkeypatch):
+    if request.param == 'stub':
+        monkeypatch.setattr(compressor, 'run_ghostscript', copy_ghostscript)
+    elif not shutil.which('ghostscript'):
+        pytest.skip('ghostscript nicht installiert')
+    return request.param
+
+
+def test_compress_pdf_chunks_merges_all_pages(ghostscript, make_issue, tmp_path):
+    source = make_issue(tmp_path / '2024-01-02_Wormser_Zeitung.pdf', pages=11)
+    output = tmp_path / 'merged.pdf'
+
+    mode, passes, _ = compressor.compress_pdf_chunks(source, output, workers=3, chunk_pages=4)
+
+    merged = PdfReader(output)
+    original = PdfReader(source)
+    assert len(merged.pages) == len(original.pages) == 11
+    # Reihenfolge der Seiten bleibt erhalten (erste Textzeile jeder Seite vergleichen)
+    first_lines = [page.extract_text().split('\n')[0] for page in original.pages]
+    assert [page.extract_text().split('\n')[0] for page in merged.pages] == first_lines
+    assert passes >= 3
+    assert mode in ('balanced', 'aggressive', 'original', 'mixed')
+    # Temporäre Seitenblöcke sind aufgeräumt
+    assert sorted(p.name for p in tmp_path.iterdir()) == ['2024-01-02_Wormser_Zeitung.pdf', 'merged.pdf']
+
+
+def write_photo_page(path, image_px, placed_pt, page_pt=(612, 792)):
+    """Eine Seite mit einem JPEG-Foto, gezeichnet in placed_pt Breite (Punkt)"""
+    photo = Image.effect_noise(image_px, 60).convert('RGB')
+    buf = io.BytesIO()
+    photo.save(buf, 'JPEG', quality=95)
+    data = buf.getvalue()
+    height_pt = placed_pt * image_px[1] / image_px[0]
+    content = f"q {placed_pt} 0 0 {height_pt:.2f} 40 400 cm /Im0 Do Q".encode()
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"<< /Type /Pages /Kids [3 0 R] /Count 1 >>",
+        (f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {page_pt[0]} {page_pt[1]}] "
+         f"/Resources << /XObject << /Im0 4 0 R >> >> /Contents 5 0 R >>").encode(),
+        (f"<< /Type /XObject /Subtype /Image /Width {image_px[0]} /Height {image_px[1]} /ColorSpace /DeviceRGB "
+         f"/BitsPerComponent 8 /Filter /DCTDecode /Length {len(data)} >>\nstream\n").encode() + data + b"\nendstream",
+        f"<< /Length {len(content)} >>\nstream\n".encode() + content + b"\nendstream",
+    ]
+    out = io.BytesIO()
+    out.write(b"%PDF-1.4\n")
+    offsets = []
+    for number, obj in enumerate(objects, start=1):
+        offsets.append(out.tell())
+        out.write(f"{number} 0 obj\n".encode() + obj + b"\nendobj\n")
+    xref = out.tell()
+    out.write(f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode())
+    for offset in offsets:
+        out.write(f"{offset:010d} 00000 n \n".encode())
+    out.write(f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode())
+    path.write_bytes(out.getvalue())
+    return path
+
+
+def test_analyze_uses_placed_image_size(tmp_path):
+    # 300 dpi Foto über ein Viertel der Seitenbreite (8,5 Zoll -> 2,125 Zoll)
+    path = write_photo_page(tmp_path / 'photo.pdf', (638, 400), placed_pt=153)
+
+    analysis = compressor.analyze_pdf(path)
+    assert analysis['images'] == 1
+    assert analysis['median_dpi'] == pytest.approx(300, rel=0.01)
+    mode, savings = compressor.predict_mode(analysis, path.stat().st_size)
+    assert mode == 'balanced'
+    assert savings > 50
+
+
+def test_borderline_prediction_keeps_balanced_pass():
+    # Bereits JPEG in RGB mit 144 dpi: Schätzung unter 10%, aber nicht deutlich -> echter Balanced-Lauf
+    analysis = {'images': 4, 'median_dpi': 144, 'image_bytes': 800, 'dct_share': 1, 'cmyk_share': 0}
+    assert compressor.predict_mode(analysis, 1000)[0] == 'balanced'
+    analysis['image_bytes'] = 300
+    assert compressor.predict_mode(analysis, 1000)[0] == 'aggressive'
+
+
+def test_audit_sample_records_balanced_result(archive, make_issue, monkeypatch):
+    source = make_issue(archive / '2024-01-02_Wormser_Zeitung.pdf', pages=2)
+    indexer.register_file(source)
+    runs = []
+
+    def shrinking_ghostscript(input_path, output_path, quality_mode='balanced'):
+        runs.append(quality_mode)
+        # Balanced bringt hier nur 5%, also folgt Aggressive
+        keep = 0.95 if quality_mode == 'balanced' else 0.5
+        output_path.write_bytes(input_path.read_bytes()[:int(input_path.stat().st_size * keep)])
+
+    monkeypatch.setattr(compressor, 'run_ghostscript', shrinking_ghostscript)
+    monkeypatch.setattr(compressor, '_predict', lambda path: ('aggressive', 3.0))
+    monkeypatch.setattr(compressor, 'COMPRESS_PREDICT_AUDIT', 1.0)
+
+    assert compressor.compress_pdf(source, linearize=False, parallel=False)
+    assert runs == ['balanced', 'aggressive']
+    conn = sqlite3.connect(indexer.DB_PATH)
+    row = conn.execute("SELECT predicted_mode, actual_mode, original_size, balanced_size, new_size "
+                       "FROM compression_stats").fetchone()
+    conn.close()
+    predicted, actual, original, balanced, new = row
+    assert (predicted, actual) == ('aggressive', 'aggressive')
+    assert balanced == int(original * 0.95)
+    assert new == source.stat().st_size == int(original * 0.5)
+
+
+@pytest.mark.parametrize('mode', [0o644, 0o664])
+def test_compress_keeps_file_mode(archive, make_issue, monkeypatch, mode):
+    source = make_issue(archive / '2024-01-02_Wormser_Zeitung.pdf', pages=2)
+    source.chmod(mode)
+    indexer.register_file(source)
+
+    def half_ghostscript(input_path, output_path, quality_mode='balanced'):
+        output_path.write_bytes(input_path.read_bytes()[:input_path.stat().st_size // 2])
+
+    monkeypatch.setattr(compressor, 'run_ghostscript', half_ghostscript)
+    monkeypatch.setattr(compressor, '_predict', lambda path: (None, None))
+
+    assert compressor.compress_pdf(source, linearize=False, parallel=False)
+    assert source.stat().st_mode & 0o777 == mode
@@ -0,0 +1,151 @@
+import os
+import stat
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+import pytest
+
+import zeitung
+
+OK_DATE = '2024-03-05'
+MISSING_DATE = '2024-03-06'
+LOGIN_DATE = '2024-03-07'
+UNKNOWN_MARKUP_DATE = '2024-03-08'
+NO_LINK_DATE = '2024-03-09'
+
+PDF_BYTES = b'%PDF-1.4\n' + b'0' * 20 * 1024 + b'\n%%EOF\n'
+
+
+def shelf_page(*dates):
+    items = ''.join(f'<div class="issue pdf-date-{d}"><span>{d}</span><a href="/pdf/{d}.pdf?x=1&amp;y=2">PDF</a></div>'
+                    for d in dates)
+    return f'<html><body><div class="shelf">{items}</div></body></html>'
+
+
+LOGIN_PAGE = ('<html><body><form action="/login"><input id="email" type="text">'
+              '<input id="password" type="password"><button type="submit">Anmelden</button></form></body></html>')
+
+
+class EpaperHandler(BaseHTTPRequestHandler):
+    """Nachbau des Regals (widgetshelf.act) und der PDF-Auslieferung des Anbieters"""
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path == '/widgetshelf.act':
+            date = parse_qs(url.query)['dateTo'][0]
+            if date == OK_DATE:
+                body = shelf_page('2024-03-04', OK_DATE)
+            elif date == MISSING_DATE:
+                # Regal zeigt die Ausgaben davor, aber keine für diesen Tag
+                body = shelf_page('2024-03-04', OK_DATE)
+            elif date == NO_LINK_DATE:
+                # Container der Ausgabe ohne Link, direkt gefolgt vom Container der nächsten Ausgabe
+                body = (f'<html><body><div class="shelf"><div class="issue pdf-date-{NO_LINK_DATE}">'
+                        f'<span>{NO_LINK_DATE}</span></div>'
+                        f'<div class="issue pdf-date-{OK_DATE}"><a href="/pdf/{OK_DATE}.pdf">PDF</a></div>'
+                        '</div></body></html>')
+            elif date == LOGIN_DATE:
+                # Abgelaufene Session: Loginformular mit Status 200
+                body = LOGIN_PAGE
+            else:
+                body = '<html><body><div id="app"></div><script src="/shelf.js"></script></body></html>'
+            self._send(200, 'text/html; charset=utf-8', body.encode())
+        elif url.path == f'/pdf/{OK_DATE}.pdf':
+            self._send(200, 'application/pdf', PDF_BYTES)
+        else:
+            self._send(404, 'text/plain', b'not found')
+
+    def _send(self, status, content_type, body):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def epaper_server():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), EpaperHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_port}"
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def scraper(epaper_server, tmp_path, monkeypatch):
+    monkeypatch.setattr(zeitung, 'base_dir', tmp_path)
+    monkeypatch.setattr(zeitung, 'SHELF_URL',
+                        epaper_server + '/widgetshelf.act?dateTo={date}&widgetId=1020&region=E120')
+    registered, no_issue = [], []
+    monkeypatch.setattr(zeitung, 'register_file', lambda path, **fields: registered.append(path.name))
+    monkeypatch.setattr(zeitung, 'mark_no_issue', no_issue.append)
+
+    scraper = zeitung.ZeitungScraper()
+    # Ohne Browser: einfache HTTP-Session statt der Cookies aus Selenium
+    monkeypatch.setattr(scraper, 'http_session', zeitung.requests.Session)
+    scraper.registered = registered
+    scraper.no_issue = no_issue
+    return scraper
+
+
+def test_download_archive_direct(scraper, tmp_path):
+    downloaded, failed = scraper.download_archive_direct([OK_DATE, MISSING_DATE, LOGIN_DATE, UNKNOWN_MARKUP_DATE])
+
+    target = tmp_path / f"{OK_DATE}_Wormser_Zeitung.pdf"
+    assert downloaded == [target]
+    assert target.read_bytes() == PDF_BYTES
+    assert scraper.registered == [target.name]
+
+    # Loginseite und unbekanntes Markup gehen an den Browser-Fallback, nur der echte Fehltag wird gemerkt
+    assert sorted(failed) == [LOGIN_DATE, UNKNOWN_MARKUP_DATE]
+    assert scraper.no_issue == [MISSING_DATE]
+
+    # Keine halben Downloads zurückgelassen
+    assert sorted(p.name for p in tmp_path.iterdir()) == [target.name]
+
+
+def test_container_without_link(scraper, tmp_path):
+    """Der Link des Nachbar-Containers darf nicht als PDF dieser Ausgabe gelten"""
+    session = zeitung.requests.Session()
+    assert scraper.find_pdf_url(session, NO_LINK_DATE) == ('error', None)
+
+    downloaded, failed = scraper.download_archive_direct([NO_LINK_DATE])
+    assert downloaded == []
+    assert failed == [NO_LINK_DATE]
+    assert scraper.no_issue == []
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_download_follows_umask(scraper, tmp_path):
+    """Die .part-Datei aus mkstemp (0600) darf ihre Rechte nicht an die Ausgabe vererben"""
+    old_umask = os.umask(0o022)
+    try:
+        downloaded, _ = scraper.download_archive_direct([OK_DATE])
+    finally:
+        os.umask(old_umask)
+
+    assert stat.S_IMODE(downloaded[0].stat().st_mode) == 0o644
+
+
+def test_login_page_instead_of_pdf(scraper, tmp_path, monkeypatch):
+    """Session läuft zwischen Regal und PDF ab: HTML statt PDF darf nie unter dem finalen Namen landen"""
+    monkeypatch.setattr(EpaperHandler, 'do_GET', _login_for_pdf(EpaperHandler.do_GET))
+    downloaded, failed = scraper.download_archive_direct([OK_DATE])
+
+    assert downloaded == []
+    assert failed == [OK_DATE]
+    assert list(tmp_path.iterdir()) == []
+
+
+def _login_for_pdf(do_get):
+    def handler(self):
+        if self.path.startswith('/pdf/'):
+            return self._send(200, 'text/html; charset=utf-8', LOGIN_PAGE.encode())
+        return do_get(self)
+    return handler
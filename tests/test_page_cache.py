@@ -0,0 +1,66 @@
+import os
+import time
+
+from PIL import Image
+
+import indexer
+
+
+def fake_render(monkeypatch):
+    """Ersetzt poppler: liefert ein Bild (Rauschen) der gewünschten Breite"""
+    def convert(path, first_page, last_page, size):
+        return [Image.effect_noise((size[0], size[0] * 4 // 3), 80).convert('RGB')]
+
+    monkeypatch.setattr(indexer, 'convert_from_path', convert)
+
+
+def lock_files():
+    return sorted(p.name for p in (indexer.PAGE_CACHE_DIR / '.locks').iterdir())
+
+
+def test_page_locks_are_pruned_with_their_images(archive, make_issue, monkeypatch):
+    fake_render(monkeypatch)
+    pdf = make_issue(archive / '2024-01-02_Wormser_Zeitung.pdf', pages=3)
+
+    first = indexer.render_page(pdf, 1, 600)
+    old = time.time() - 3600
+    os.utime(first, (old, old))
+    # Cache auf die Größe eines Bildes begrenzen: das nächste Bild verdrängt das älteste
+    monkeypatch.setattr(indexer, 'PAGE_CACHE_MAX_MB', first.stat().st_size * 1.5 / 1024 / 1024)
+    second = indexer.render_page(pdf, 2, 600)
+
+    assert not first.exists() and second.exists()
+    assert lock_files() == [f"{second.stem}.lock"]
+    assert not (indexer.THUMB_DIR / '.locks').exists()
+
+
+def test_page_locks_are_removed_with_the_issue(archive, make_issue, monkeypatch):
+    fake_render(monkeypatch)
+    pdf = make_issue(archive / '2024-01-02_Wormser_Zeitung.pdf', pages=3)
+    indexer.register_file(pdf)
+    for page in (1, 2, 3):
+        indexer.render_page(pdf, page, 900)
+    assert len(lock_files()) == 3
+
+    indexer.delete_file_data(archive, pdf.name)
+
+    assert lock_files() == []
+    assert [p for p in indexer.PAGE_CACHE_DIR.iterdir() if p.is_file()] == []
+
+
+def test_page_pruned_during_cache_hit_is_rendered_again(archive, make_issue, monkeypatch):
+    fake_render(monkeypatch)
+    pdf = make_issue(archive / '2024-01-02_Wormser_Zeitung.pdf', pages=2)
+    page = indexer.render_page(pdf, 1, 600)
+
+    # Ein anderer Worker räumt das Bild zwischen exists() und utime() weg
+    utime = os.utime
+
+    def pruned_utime(path, *args, **kwargs):
+        if str(path) == str(page):
+            os.remove(path)
+        return utime(path, *args, **kwargs)
+
+    monkeypatch.setattr(os, 'utime', pruned_utime)
+    assert indexer.render_page(pdf, 1, 600) == page
+    assert page.exists()
@@ -0,0 +1,41 @@
+import sqlite3
+from concurrent.futures import Future
+
+import pytest
+
+import indexer
+import pipeline
+
+
+def test_locked_database_keeps_item_open(archive, make_issue, monkeypatch):
+    """Schlägt das Schreiben des Index fehl, darf die Pipeline die Ausgabe nicht als fertig abhaken"""
+    issue = make_issue(archive / '2024-03-05_Wormser_Zeitung.pdf')
+    monkeypatch.setattr(indexer, 'INDEX_WRITE_TIMEOUT', 0.1)
+
+    blocker = sqlite3.connect(indexer.DB_PATH)
+    blocker.execute("BEGIN EXCLUSIVE")
+    try:
+        assert indexer.index_pdf(issue) is False
+        with pytest.raises(RuntimeError):
+            pipeline._index_item(issue)
+    finally:
+        blocker.rollback()
+        blocker.close()
+
+    # Sperre weg: der nächste Versuch schreibt den Index
+    pipeline._index_item(issue)
+    conn = sqlite3.connect(indexer.DB_PATH)
+    assert conn.execute("SELECT COUNT(*) FROM manifest WHERE filename = ?", (issue.name,)).fetchone()[0] == 1
+    conn.close()
+
+
+def test_stage_lives_in_the_archive_database(archive):
+    """Pipeline, Jobs und Index teilen sich eine Datenbank (indexer.DB_PATH, auch wenn sie umgebogen wird)"""
+    pipeline.init_db()
+    failed = Future()
+    failed.set_exception(RuntimeError("Index nicht geschrieben"))
+    pipeline.ArchivePipeline._indexed(None, archive / '2024-03-05_Wormser_Zeitung.pdf', failed)
+
+    conn = sqlite3.connect(archive / 'zeitung.db')
+    assert conn.execute("SELECT stage, error FROM pipeline_items").fetchall() == [('compressed', 'Index nicht geschrieben')]
+    conn.close()
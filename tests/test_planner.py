@@ -0,0 +1,36 @@
+import sqlite3
+from datetime import date, timedelta
+
+import indexer
+import planner
+
+
+def insert_no_issue(day, checked):
+    conn = sqlite3.connect(indexer.DB_PATH)
+    conn.execute("INSERT OR REPLACE INTO no_issue_dates (date, checked) VALUES (?, ?)", (day, checked))
+    conn.commit()
+    conn.close()
+
+
+def test_recent_days_are_not_marked(archive):
+    today = date.today()
+    indexer.mark_no_issue(today.isoformat())
+    indexer.mark_no_issue((today - timedelta(days=1)).isoformat())
+    old_day = (today - timedelta(days=30)).isoformat()
+    indexer.mark_no_issue(old_day)
+
+    assert indexer.get_no_issue_dates() == {old_day}
+
+
+def test_premature_and_expired_entries_are_rechecked(archive):
+    today = date.today()
+    # Am Erscheinungstag selbst geprüft: zu früh, zählt nicht
+    insert_no_issue('2024-05-14', '2024-05-14 08:00:00')
+    # Vor über NO_ISSUE_TTL_DAYS geprüft: abgelaufen
+    insert_no_issue('2024-05-15', '2024-05-20 08:00:00')
+    recent_check = (today - timedelta(days=1)).isoformat() + ' 08:00:00'
+    insert_no_issue('2024-05-16', recent_check)
+
+    assert indexer.get_no_issue_dates() == {'2024-05-16'}
+    # 14. und 15. (Di, Mi) werden wieder eingeplant, der 16. nicht
+    assert planner.plan_missing_dates('2024-05-14', '2024-05-16') == ['2024-05-15', '2024-05-14']
@@ -4,10 +4,19 @@ import logging
 import shutil
 import subprocess
 import re
+import json
+import html
+import tempfile
+import select
+import ctypes
+import ctypes.util
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime, timedelta
 from pathlib import Path
+from urllib.parse import urljoin, urlparse
 import glob
 
+import requests
 import undetected_chromedriver as uc
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
@@ -16,6 +25,11 @@ from selenium.common import exceptions
 from discord_webhook import DiscordWebhook
 from dotenv import load_dotenv
 
+import metrics
+from indexer import register_file, mark_no_issue
+from planner import plan_missing_dates
+from jobs import report_progress
+
 # Kompressor Import (wird hier nicht mehr automatisch genutzt, aber import bleibt falls benötigt)
 try:
     from compressor import compress_pdf
@@ -56,19 +70,132 @@ SITE_CONFIG = {
 }
 DISCORD_URL = os.getenv("DISCORD_WEBHOOK_URL")
 
+# Archiv-Downloads direkt per HTTP (mit den Cookies der Browser-Session) statt per Klick im Browser
+DIRECT_DOWNLOAD = os.getenv("DIRECT_DOWNLOAD", "True").lower() == "true"
+# Gleichzeitige HTTP-Downloads (klein halten, um den Anbieter nicht zu überlasten)
+DOWNLOAD_CONCURRENCY = max(1, int(os.getenv("DOWNLOAD_CONCURRENCY", "3")))
+_paper_url = urlparse(SITE_CONFIG["url"])
+EPAPER_BASE = f"{_paper_url.scheme}://{_paper_url.netloc}"
+SHELF_URL = EPAPER_BASE + "/widgetshelf.act?dateTo={date}&widgetId=1020&region=E120"
+# Abgelaufene Session: Weiterleitung zum SSO bzw. Loginformular statt Regal (Status trotzdem 200)
+LOGIN_PAGE_PATTERN = re.compile(r'<input[^>]+type=["\']password["\']|id=["\']password["\']', re.I)
+# Irgendein Ausgaben-Container im Regal (zeigt, dass das Markup wie erwartet ist)
+ISSUE_CONTAINER_PATTERN = re.compile(r'pdf-date-\d{4}-\d{2}-\d{2}')
+
+# Browser-Profil (Cookies, Login-Session, Cookie-Banner) und gepatchter Treiber überleben Neustarts
+CHROME_DIR = base_dir / ".chrome"
+CHROME_PROFILE_DIR = CHROME_DIR / "profile"
+CHROME_DRIVER_CACHE = CHROME_DIR / "chromedriver"
+CHROME_VERSION_CACHE = CHROME_DIR / "version.json"
+# Session zwischen den Läufen behalten (kein Logout, kein SSO-Login beim nächsten Start)
+PERSIST_SESSION = os.getenv("PERSIST_SESSION", "True").lower() == "true"
+
+# inotify Konstanten (linux/inotify.h)
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+
+
+def _umask():
+    """Aktuelle umask (lässt sich nur durch Setzen auslesen)"""
+    mask = os.umask(0)
+    os.umask(mask)
+    return mask
+
+
+class DownloadWatcher:
+    """
+    Wartet auf fertige Downloads in einem (kleinen) Staging-Ordner.
+    Chrome schreibt in eine .crdownload Datei und benennt sie erst am Ende in .pdf um,
+    eine .pdf im Staging-Ordner ist also immer vollständig.
+    Unter Linux weckt inotify beim Umbenennen auf, sonst wird der Ordner gepollt.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.fd = None
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+            fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+            if fd >= 0:
+                if libc.inotify_add_watch(fd, str(directory).encode(), IN_CLOSE_WRITE | IN_MOVED_TO) >= 0:
+                    self.fd = fd
+                else:
+                    os.close(fd)
+        except (OSError, AttributeError):
+            pass
+
+    def finished(self):
+        with os.scandir(self.directory) as it:
+            return [Path(entry.path) for entry in it if entry.name.endswith('.pdf')]
+
+    def wait(self, timeout):
+        """Gibt die erste fertige PDF zurück (None bei Timeout)"""
+        end_time = time.time() + timeout
+        while True:
+            # Erst nachsehen, dann warten: Events zwischen beiden Schritten machen den fd trotzdem lesbar
+            done = self.finished()
+            if done:
+                return done[0]
+            remaining = end_time - time.time()
+            if remaining <= 0:
+                return None
+            if self.fd is not None:
+                select.select([self.fd], [], [], remaining)
+                try:
+                    os.read(self.fd, 4096)
+                except BlockingIOError:
+                    pass
+            else:
+                time.sleep(min(0.5, remaining))
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
 
 class ZeitungScraper:
-    def __init__(self):
+    def __init__(self, on_file=None):
         self.driver = None
+        # Wird für jede fertig heruntergeladene Datei aufgerufen (z.B. ArchivePipeline.submit)
+        self.on_file = on_file
         self.wait = None
         self.target_path = None
+        # Eigener Download-Ordner pro Lauf, damit die Erkennung nicht das ganze Archiv durchsuchen muss
+        self.staging_dir = base_dir / ".staging" / f"{os.getpid()}-{int(time.time())}"
+
+    def load_chrome_cache(self):
+        try:
+            return json.loads(CHROME_VERSION_CACHE.read_text())
+        except (OSError, ValueError):
+            return {}
+
+    def save_chrome_cache(self, **fields):
+        cache = self.load_chrome_cache()
+        cache.update(fields)
+        CHROME_DIR.mkdir(parents=True, exist_ok=True)
+        CHROME_VERSION_CACHE.write_text(json.dumps(cache))
 
     def get_docker_chrome_version(self):
+        # Version nur neu abfragen, wenn sich das Chrome-Binary geändert hat (z.B. neues Image)
+        chrome_binary = shutil.which('google-chrome')
+        try:
+            binary_mtime = os.stat(os.path.realpath(chrome_binary)).st_mtime if chrome_binary else None
+        except OSError:
+            binary_mtime = None
+        cache = self.load_chrome_cache()
+        if binary_mtime and cache.get('chrome_mtime') == binary_mtime and cache.get('chrome_version'):
+            return cache['chrome_version']
+
         try:
             result = subprocess.run(['google-chrome', '--version'], capture_output=True, text=True)
             output = result.stdout.strip()
             match = re.search(r'(\d+)', output)
-            if match: return int(match.group(1))
+            if match:
+                version = int(match.group(1))
+                if binary_mtime:
+                    self.save_chrome_cache(chrome_mtime=binary_mtime, chrome_version=version)
+                return version
         except:
             pass
         return None
@@ -94,8 +221,9 @@ class ZeitungScraper:
         if SITE_CONFIG["proxy"]:
             options.add_argument(f'--proxy-server={SITE_CONFIG["proxy"]}')
 
+        self.staging_dir.mkdir(parents=True, exist_ok=True)
         prefs = {
-            'download.default_directory': str(base_dir.absolute()),
+            'download.default_directory': str(self.staging_dir.absolute()),
             'download.prompt_for_download': False,
             'download.directory_upgrade': True,
             'safebrowsing.enabled': True,
@@ -107,23 +235,82 @@ class ZeitungScraper:
         kwargs = {'options': options}
         if target_version: kwargs['version_main'] = target_version
 
+        # Gepatchten Treiber wiederverwenden, solange er zur Chrome-Version passt (spart Download + Patch)
+        cache = self.load_chrome_cache()
+        warm = CHROME_DRIVER_CACHE.exists() and cache.get('driver_version') == target_version
+        if warm:
+            kwargs['driver_executable_path'] = str(CHROME_DRIVER_CACHE)
+
+        if PERSIST_SESSION:
+            CHROME_PROFILE_DIR.mkdir(parents=True, exist_ok=True)
+            # Sperrdateien eines abgestürzten Laufs verhindern sonst den Start
+            for lock in ('SingletonLock', 'SingletonSocket', 'SingletonCookie'):
+                try:
+                    os.remove(CHROME_PROFILE_DIR / lock)
+                except OSError:
+                    pass
+            kwargs['user_data_dir'] = str(CHROME_PROFILE_DIR)
+
+        start = time.time()
         self.driver = uc.Chrome(**kwargs)
         self.wait = WebDriverWait(self.driver, 30)
+        logger.info(f"Browser-Start ({'warm' if warm else 'kalt'}): {time.time() - start:.1f} s")
+
+        if not warm:
+            try:
+                CHROME_DIR.mkdir(parents=True, exist_ok=True)
+                tmp_path = CHROME_DRIVER_CACHE.with_suffix('.tmp')
+                shutil.copy2(self.driver.patcher.executable_path, tmp_path)
+                os.replace(tmp_path, CHROME_DRIVER_CACHE)
+                self.save_chrome_cache(driver_version=target_version)
+            except Exception as e:
+                logger.warning(f"Treiber konnte nicht zwischengespeichert werden: {e}")
+
+        # Headless Chrome ignoriert die Download-Prefs teilweise, daher zusätzlich per DevTools setzen
+        try:
+            self.driver.execute_cdp_cmd("Page.setDownloadBehavior", {
+                "behavior": "allow", "downloadPath": str(self.staging_dir.absolute())})
+        except Exception as e:
+            logger.warning(f"Download-Ordner per DevTools nicht gesetzt: {e}")
+
+    def clear_staging(self):
+        """Reste abgebrochener Downloads aus dem Staging-Ordner entfernen"""
+        for f in self.staging_dir.iterdir():
+            try:
+                os.remove(f)
+            except OSError:
+                pass
+
+    def quit(self):
+        if self.driver:
+            self.driver.quit()
+        shutil.rmtree(self.staging_dir, ignore_errors=True)
 
     def login(self):
         s = SITE_CONFIG["selectors"]
         c = SITE_CONFIG["credentials"]
 
+        start = time.time()
         self.driver.get(SITE_CONFIG["url"])
 
+        # Mit gespeichertem Profil ist der Cookie-Banner schon bestätigt und die Session oft noch gültig:
+        # auf das erste der beiden Elemente warten statt nacheinander auf beide
+        try:
+            WebDriverWait(self.driver, 5).until(EC.any_of(
+                EC.presence_of_element_located(s["logout_btn"]),
+                EC.element_to_be_clickable(s["cookie_accept_btn"])))
+        except:
+            pass
+
         try:
-            WebDriverWait(self.driver, 5).until(EC.element_to_be_clickable(s["cookie_accept_btn"])).click()
+            self.driver.find_element(*s["cookie_accept_btn"]).click()
             time.sleep(1)
         except:
             pass
 
         try:
             WebDriverWait(self.driver, 3).until(EC.presence_of_element_located(s["logout_btn"]))
+            logger.info(f"Login: gespeicherte Session gültig ({time.time() - start:.1f} s)")
             return
         except:
             pass
@@ -141,8 +328,12 @@ class ZeitungScraper:
 
         self.driver.execute_script("arguments[0].click();", self.driver.find_element(*s["login_submit_btn"]))
         self.wait.until(EC.url_contains("vrm-epaper.de"))
+        logger.info(f"Login: SSO Anmeldung ({time.time() - start:.1f} s)")
 
     def logout(self):
+        if PERSIST_SESSION:
+            # Session bleibt im Profil für den nächsten Lauf erhalten
+            return
         try:
             logger.info("Führe Logout durch...")
             self.driver.get(SITE_CONFIG["url"])
@@ -155,96 +346,216 @@ class ZeitungScraper:
         except Exception as e:
             logger.warning(f"Logout nicht möglich: {e}")
 
-    def get_existing_pdfs(self):
-        return set(base_dir.glob("*.pdf"))
-
     def cleanup_failed_attempts(self, filename_base):
-        pattern = f"{filename_base.replace('.pdf', '')}*"
-        for f in base_dir.glob(pattern):
-            try:
-                if f.stat().st_size == 0:
-                    logger.warning(f"Lösche defekte 0-Byte Datei: {f.name}")
-                    os.remove(f)
-                elif re.search(r'\(\d+\)\.pdf$', f.name):
-                    logger.warning(f"Lösche Duplikat: {f.name}")
-                    os.remove(f)
-            except Exception as e:
-                logger.error(f"Fehler beim Bereinigen von {f.name}: {e}")
+        # Duplikate wie "(1).pdf" entstehen nur noch im Staging-Ordner, hier bleibt die 0-Byte Prüfung
+        f = base_dir / filename_base
+        try:
+            if f.exists() and f.stat().st_size == 0:
+                logger.warning(f"Lösche defekte 0-Byte Datei: {f.name}")
+                os.remove(f)
+        except Exception as e:
+            logger.error(f"Fehler beim Bereinigen von {f.name}: {e}")
 
-    def wait_for_download(self, filename_to_save, pre_existing_files):
+    def wait_for_download(self, filename_to_save, watcher):
         logger.info(f"Warte auf NEUEN Download für: {filename_to_save}")
 
-        for temp in base_dir.glob("*.crdownload"):
-            try:
-                os.remove(temp)
-            except:
-                pass
-
-        end_time = time.time() + 180
         target_file = base_dir / filename_to_save
-        stuck_counter = 0
+        candidate = watcher.wait(180)
+        if candidate is None:
+            logger.warning(f"Timeout! Keine valide Datei erhalten.")
+            return None
+
+        size = candidate.stat().st_size
+        if size == 0:
+            logger.error(f"Download mit 0 Bytes: {candidate.name}. Breche ab.")
+            os.remove(candidate)
+            return None
+
+        logger.info(f"Download fertig erkannt: {candidate.name} ({size} Bytes)")
+        try:
+            # Staging-Ordner liegt im Download-Ordner, das Verschieben ist also ein atomares Umbenennen
+            os.replace(candidate, target_file)
+            logger.info(f"Gespeichert als: {filename_to_save}")
+            # WICHTIG: Auto-Komprimierung hier entfernt!
+            # Frischer Download vom Anbieter: noch nicht komprimiert/linearisiert
+            register_file(target_file, compressed=0, linearized=0)
+            return target_file
+        except Exception as e:
+            logger.error(f"Fehler beim Umbenennen: {e}")
+            return None
+
+    def http_session(self):
+        """Übernimmt Cookies und User-Agent der eingeloggten Browser-Session in einen HTTP-Client"""
+        session = requests.Session()
+        for cookie in self.driver.get_cookies():
+            session.cookies.set(cookie['name'], cookie['value'], domain=cookie.get('domain'), path=cookie.get('path', '/'))
+        session.headers['User-Agent'] = self.driver.execute_script("return navigator.userAgent")
+        if SITE_CONFIG["proxy"]:
+            session.proxies = {'http': SITE_CONFIG["proxy"], 'https': SITE_CONFIG["proxy"]}
+        return session
+
+    def find_pdf_url(self, session, date_str_iso):
+        """
+        Sucht den PDF-Link einer Ausgabe im Regal.
+        Rückgabe: (status, url) mit status 'ok', 'missing' (das Regal zeigt andere Ausgaben,
+        aber nicht diese) oder 'error' (Loginseite, unbekanntes Markup -> Browser-Fallback)
+        """
+        shelf_url = SHELF_URL.format(date=date_str_iso)
+        response = session.get(shelf_url, timeout=30)
+        response.raise_for_status()
+        if 'sso' in urlparse(response.url).netloc or LOGIN_PAGE_PATTERN.search(response.text):
+            logger.warning(f"Regal für {date_str_iso} liefert eine Loginseite (Session abgelaufen?)")
+            return 'error', None
+        # Nur innerhalb des Containers suchen, nicht bis in den Link der nächsten Ausgabe
+        match = re.search(rf'pdf-date-{date_str_iso}[^>]*>(?:(?!pdf-date-).)*?<a[^>]*href="([^"]+)"',
+                          response.text, re.S)
+        if match:
+            return 'ok', urljoin(response.url, html.unescape(match.group(1)))
+        if f'pdf-date-{date_str_iso}' in response.text:
+            # Ausgabe ist da, nur ohne Link im Markup: kein Fehltag, der Browser versucht es
+            logger.warning(f"Ausgabe {date_str_iso} im Regal ohne PDF-Link")
+            return 'error', None
+        if ISSUE_CONTAINER_PATTERN.search(response.text):
+            return 'missing', None
+        # Leeres oder per JavaScript nachgeladenes Regal: das entscheidet der Browser
+        logger.warning(f"Regal für {date_str_iso} ohne erkennbare Ausgaben (Markup geändert?)")
+        return 'error', None
+
+    def download_direct(self, session, date_str_iso, target_path):
+        """
+        Lädt eine Ausgabe direkt per HTTP herunter.
+        Rückgabe: 'ok', 'missing' (keine Ausgabe) oder 'error' (Browser-Fallback versuchen)
+        """
+        started = time.perf_counter()
+        status = self._download_direct(session, date_str_iso, target_path)
+        metrics.SCRAPE_DAY_SECONDS.labels(method='http', attempt='1', result=status).observe(
+            time.perf_counter() - started)
+        return status
+
+    def _download_direct(self, session, date_str_iso, target_path):
+        try:
+            status, pdf_url = self.find_pdf_url(session, date_str_iso)
+            if status != 'ok':
+                return status
+
+            with session.get(pdf_url, stream=True, timeout=60) as response:
+                response.raise_for_status()
+                # In eine temporäre Datei streamen und erst am Ende umbenennen,
+                # damit nie eine halbe PDF unter dem finalen Namen liegt
+                fd, tmp_name = tempfile.mkstemp(dir=base_dir, prefix=f".{target_path.stem}.", suffix='.part')
+                try:
+                    with os.fdopen(fd, 'wb') as f:
+                        first = True
+                        for chunk in response.iter_content(chunk_size=256 * 1024):
+                            if first:
+                                # Abgelaufene Session liefert eine HTML-Loginseite statt der PDF
+                                if not chunk.startswith(b'%PDF'):
+                                    raise ValueError("Antwort ist keine PDF")
+                                first = False
+                            f.write(chunk)
+                    if os.path.getsize(tmp_name) < 10 * 1024:
+                        raise ValueError("Datei zu klein")
+                    # mkstemp legt 0600 an, Browser-Downloads folgen der umask
+                    os.chmod(tmp_name, 0o666 & ~_umask())
+                    os.replace(tmp_name, target_path)
+                except BaseException:
+                    if os.path.exists(tmp_name):
+                        os.remove(tmp_name)
+                    raise
+
+            logger.info(f"HTTP Download fertig: {target_path.name} ({target_path.stat().st_size} Bytes)")
+            return 'ok'
+        except Exception as e:
+            logger.warning(f"HTTP Download für {date_str_iso} fehlgeschlagen: {e}")
+            return 'error'
+
+    def download_archive_direct(self, dates):
+        """
+        Lädt mehrere Ausgaben parallel per HTTP.
+        Gibt (heruntergeladene Pfade, Daten für den Browser-Fallback) zurück.
+        """
+        session = self.http_session()
+        downloaded, failed = [], []
+        done = 0
+        with ThreadPoolExecutor(max_workers=DOWNLOAD_CONCURRENCY) as executor:
+            futures = {
+                executor.submit(self.download_direct, session, date_str_iso,
+                                base_dir / f"{date_str_iso}_Wormser_Zeitung.pdf"): date_str_iso
+                for date_str_iso in dates
+            }
+            for future in as_completed(futures):
+                date_str_iso = futures[future]
+                target_path = base_dir / f"{date_str_iso}_Wormser_Zeitung.pdf"
+                status = future.result()
+                if status == 'ok':
+                    register_file(target_path, compressed=0, linearized=0)
+                    downloaded.append(target_path)
+                    self.file_done(target_path)
+                elif status == 'missing':
+                    logger.warning(f"Keine Ausgabe für {date_str_iso} gefunden.")
+                    mark_no_issue(date_str_iso)
+                else:
+                    failed.append(date_str_iso)
+                done += 1
+                report_progress(done, len(dates), item=date_str_iso)
+        return downloaded, failed
 
-        while time.time() < end_time:
-            current_files = set(base_dir.glob("*.pdf"))
-            new_files = current_files - pre_existing_files
-            temp_files = list(base_dir.glob("*.crdownload"))
+    def download_day_browser(self, date_str_iso):
+        """Lädt eine Ausgabe über einen Klick im Browser (langsam, aber robust)"""
+        target_filename = f"{date_str_iso}_Wormser_Zeitung.pdf"
 
-            if new_files:
-                candidate = list(new_files)[0]
+        for attempt in range(1, 4):
+            logger.info(f"Versuch {attempt}/3 für {date_str_iso}...")
+            self.cleanup_failed_attempts(target_filename)
+            started = time.perf_counter()
 
-                if any(t.name.startswith(candidate.name) for t in temp_files):
-                    time.sleep(1)
-                    continue
+            def observe(result):
+                metrics.SCRAPE_DAY_SECONDS.labels(method='browser', attempt=str(attempt), result=result).observe(
+                    time.perf_counter() - started)
 
-                try:
-                    if candidate.stat().st_size == 0:
-                        stuck_counter += 1
-                        if stuck_counter > 30:
-                            logger.error(f"Download hängt bei 0 Bytes: {candidate.name}. Breche ab.")
-                            try:
-                                os.remove(candidate)
-                            except:
-                                pass
-                            return None
-                        time.sleep(1)
-                        continue
-                    else:
-                        stuck_counter = 0
-                except OSError:
-                    continue
+            try:
+                self.driver.get(SHELF_URL.format(date=date_str_iso))
+                time.sleep(3)
 
+                css_selector = f".pdf-date-{date_str_iso}"
                 try:
-                    initial_size = candidate.stat().st_size
-                    time.sleep(2)
-                    if candidate.stat().st_size != initial_size:
-                        continue
-                except:
-                    continue
-
-                logger.info(f"Download fertig erkannt: {candidate.name} ({initial_size} Bytes)")
-
-                if candidate.name != filename_to_save:
-                    if target_file.exists():
-                        try:
-                            os.remove(target_file)
-                        except:
-                            pass
+                    container = self.driver.find_element(By.CSS_SELECTOR, css_selector)
+                    link = container.find_element(By.TAG_NAME, "a")
 
+                    self.clear_staging()
+                    watcher = DownloadWatcher(self.staging_dir)
                     try:
-                        shutil.move(str(candidate), str(target_file))
-                        logger.info(f"Gespeichert als: {filename_to_save}")
-                        # WICHTIG: Auto-Komprimierung hier entfernt!
-                        return target_file
-                    except Exception as e:
-                        logger.error(f"Fehler beim Umbenennen: {e}")
-                        return None
-                else:
-                    # WICHTIG: Auto-Komprimierung hier entfernt!
-                    return target_file
+                        logger.info(f"Klicke Download...")
+                        self.driver.execute_script("arguments[0].click();", link)
 
-            time.sleep(1)
+                        time.sleep(3)
+                        self.handle_tabs()
+
+                        res = self.wait_for_download(target_filename, watcher)
+                    finally:
+                        watcher.close()
+                    if res:
+                        observe('ok')
+                        time.sleep(1)
+                        return res
+                    else:
+                        observe('error')
+                        logger.warning(f"Download fehlgeschlagen.")
+
+                except exceptions.NoSuchElementException:
+                    # Nur ein geladenes Regal mit anderen Ausgaben beweist, dass es diese nicht gibt
+                    if not self.driver.find_elements(By.CSS_SELECTOR, "[class*='pdf-date-']"):
+                        raise RuntimeError("Regal ohne Ausgaben geladen (Loginseite oder Seite unvollständig)")
+                    observe('missing')
+                    logger.warning(f"Keine Ausgabe für {date_str_iso} gefunden.")
+                    mark_no_issue(date_str_iso)
+                    return None
+
+            except Exception as e:
+                observe('error')
+                logger.error(f"Fehler bei {date_str_iso} (Versuch {attempt}): {e}")
+                time.sleep(5)
 
-        logger.warning(f"Timeout! Keine valide Datei erhalten.")
         return None
 
     def handle_tabs(self):
@@ -286,12 +597,16 @@ class ZeitungScraper:
                     download_btn = self.wait.until(EC.element_to_be_clickable(s["download_btn"]))
                     self.driver.execute_script("arguments[0].scrollIntoView();", download_btn)
 
-                    known_files = self.get_existing_pdfs()
-                    download_btn.click()
-                    time.sleep(2)
-                    self.handle_tabs()
+                    self.clear_staging()
+                    watcher = DownloadWatcher(self.staging_dir)
+                    try:
+                        download_btn.click()
+                        time.sleep(2)
+                        self.handle_tabs()
 
-                    saved_path = self.wait_for_download(filename, known_files)
+                        saved_path = self.wait_for_download(filename, watcher)
+                    finally:
+                        watcher.close()
                     if saved_path:
                         self.target_path = saved_path
                         break
@@ -307,69 +622,55 @@ class ZeitungScraper:
         except Exception as e:
             logger.error(f"Daily Error: {e}")
         finally:
-            if self.driver: self.driver.quit()
+            self.quit()
 
     def run_archive(self, start_date_str, days_range):
+        """Lädt die fehlenden Ausgaben von start_date_str an days_range Tage rückwärts"""
+        start_date = datetime.strptime(start_date_str, "%Y-%m-%d")
+        oldest = (start_date - timedelta(days=days_range - 1)).strftime("%Y-%m-%d")
+        return self.download_dates(plan_missing_dates(oldest, start_date_str))
+
+    def run_fill_gaps(self, since_str):
+        """Lädt alle fehlenden Ausgaben seit since_str bis heute"""
+        return self.download_dates(plan_missing_dates(since_str))
+
+    def file_done(self, path):
+        if self.on_file:
+            try:
+                self.on_file(path)
+            except Exception as e:
+                logger.error(f"Weiterverarbeitung von {path.name} fehlgeschlagen: {e}")
+
+    def download_dates(self, dates):
         downloaded_files = []
+        if not dates:
+            logger.info("Keine fehlenden Ausgaben, nichts zu tun.")
+            return downloaded_files
         try:
             self.setup_driver()
             self.login()
 
-            start_date = datetime.strptime(start_date_str, "%Y-%m-%d")
-
-            for i in range(days_range):
-                current_date = start_date - timedelta(days=i)
-                date_str_iso = current_date.strftime("%Y-%m-%d")
-                target_filename = f"{date_str_iso}_Wormser_Zeitung.pdf"
-                target_path = base_dir / target_filename
-
-                if target_path.exists() and target_path.stat().st_size > 10 * 1024:
-                    logger.info(f"Überspringe {date_str_iso}, existiert bereits.")
-                    continue
-
-                for attempt in range(1, 4):
-                    logger.info(f"Versuch {attempt}/3 für {date_str_iso}...")
-                    self.cleanup_failed_attempts(target_filename)
-
-                    try:
-                        url = f"https://vrm-epaper.de/widgetshelf.act?dateTo={date_str_iso}&widgetId=1020&region=E120"
-                        self.driver.get(url)
-                        time.sleep(3)
-
-                        css_selector = f".pdf-date-{date_str_iso}"
-                        try:
-                            container = self.driver.find_element(By.CSS_SELECTOR, css_selector)
-                            link = container.find_element(By.TAG_NAME, "a")
-
-                            known_files = self.get_existing_pdfs()
-                            logger.info(f"Klicke Download...")
-                            self.driver.execute_script("arguments[0].click();", link)
-
-                            time.sleep(3)
-                            self.handle_tabs()
-
-                            res = self.wait_for_download(target_filename, known_files)
-                            if res:
-                                downloaded_files.append(res)
-                                time.sleep(1)
-                                break
-                            else:
-                                logger.warning(f"Download fehlgeschlagen.")
-
-                        except exceptions.NoSuchElementException:
-                            logger.warning(f"Keine Ausgabe für {date_str_iso} gefunden.")
-                            break
-
-                    except Exception as e:
-                        logger.error(f"Fehler bei {date_str_iso} (Versuch {attempt}): {e}")
-                        time.sleep(5)
-
+            missing = dates
+            if DIRECT_DOWNLOAD:
+                logger.info(f"Lade {len(missing)} Ausgaben per HTTP ({DOWNLOAD_CONCURRENCY} parallel)...")
+                downloaded_files, missing = self.download_archive_direct(missing)
+                if missing:
+                    logger.info(f"{len(missing)} Ausgaben werden über den Browser nachgeladen.")
+
+            for i, date_str_iso in enumerate(missing):
+                report_progress(i, len(missing), item=date_str_iso)
+                res = self.download_day_browser(date_str_iso)
+                if res:
+                    downloaded_files.append(res)
+                    self.file_done(res)
+
+            report_progress(len(dates), len(dates))
             self.logout()
 
         except Exception as e:
             logger.error(f"Archiv Error: {e}")
         finally:
-            if self.driver: self.driver.quit()
+            self.quit()
 
         return downloaded_files
 